@@ -0,0 +1,245 @@
+import re
+import time
+import json
+import random
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+from core.similarity_index import MinHashIndex
+from core.evolution_tracker import EvolutionTracker
+from core.evolution_transaction import EvolutionConflictError, EvolutionValidationError
+from utils.evolution_applier import apply_evolution_async
+from utils.evolution_models import EvolutionOutput
+
+logger = logging.getLogger(__name__)
+
+class EvolutionScheduler:
+    """
+    リクエストごとにevolution_crewを回す代わりに、トラフィックから標本を抽出して
+    一定件数または一定時間のウィンドウごとに1回だけevolution_crewを実行する。
+    - record(): 回答ごとに呼ぶ（失敗は必ず保持、それ以外はsample_rateで抽出、上限max_samples）
+    - maybe_run(): ウィンドウ条件を満たせばダイジェストを作ってevolution_crewを1回実行し、
+      バリデーション付きのapply_evolution_asyncで適用する
+    失敗時の扱い（コストをウィンドウあたり1回程度に保つ）:
+    - 出力が不正・進化案が拒否された場合は再実行しても同じ結果になりやすいため、ウィンドウを破棄して記録する
+    - crew実行の例外など一時的な失敗のみ標本を戻し、retry_secondsから倍々で最大max_retry_seconds
+      （既定はwindow_seconds）待って再試行する
+    設定はevolution_crew YAMLの schedule ブロック。
+    """
+
+    def __init__(self, sample_rate: float = 0.2, window_size: int = 50, window_seconds: float = 3600,
+                 min_samples: int = 5, max_samples: int = 500, max_chars: int = 300,
+                 top_clusters: int = 10, max_examples: int = 5, crew_name: str = "evolution_crew",
+                 retry_seconds: float = 300, max_retry_seconds: Optional[float] = None,
+                 enabled: bool = True):
+        self.sample_rate = sample_rate
+        self.window_size = window_size
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.max_chars = max_chars
+        self.top_clusters = top_clusters
+        self.max_examples = max_examples
+        self.crew_name = crew_name
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = window_seconds if max_retry_seconds is None else max_retry_seconds
+        self.enabled = enabled
+        self.samples: Deque[Dict[str, Any]] = deque(maxlen=max_samples)
+        self.seen = 0
+        self.window_started = time.monotonic()
+        self.runs = 0
+        self.failures = 0
+        self.dropped = 0
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._consecutive_failures = 0
+        self._retry_at = 0.0
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def from_crew_config(cls, crew_config: Dict[str, Any]) -> "EvolutionScheduler":
+        conf = crew_config.get("schedule") or {}
+        return cls(**conf)
+
+    def _clip(self, text: str) -> str:
+        text = text or ""
+        return text if len(text) <= self.max_chars else text[:self.max_chars] + "…"
+
+    def record(self, prompt: str, answer: str = "", latency: float = 0.0,
+               error: Optional[str] = None, request_id: Optional[str] = None) -> bool:
+        """1件のやり取りを標本候補として記録する。保持した場合True"""
+        self.seen += 1
+        if not self.enabled:
+            return False
+        if error is None and random.random() >= self.sample_rate:
+            return False
+        self.samples.append({
+            "prompt": self._clip(prompt),
+            "answer": self._clip(answer),
+            "latency": latency,
+            "error": error,
+            "request_id": request_id,
+        })
+        return True
+
+    def window_ready(self) -> bool:
+        if not self.enabled or len(self.samples) < self.min_samples or time.monotonic() < self._retry_at:
+            return False
+        elapsed = time.monotonic() - self.window_started
+        return len(self.samples) >= self.window_size or elapsed >= self.window_seconds
+
+    def build_digest(self, samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """ウィンドウ内の標本を、類似プロンプトのクラスタ・失敗例・レイテンシ外れ値に要約する"""
+        index = MinHashIndex()
+        clusters: List[Dict[str, Any]] = []
+        for sample in samples:
+            matches = index.query(sample["prompt"], 0.5)
+            if matches:
+                cluster = clusters[int(matches[0][0])]
+                cluster["count"] += 1
+            else:
+                index.add(str(len(clusters)), sample["prompt"])
+                clusters.append({"representative": sample["prompt"], "example_answer": sample["answer"], "count": 1})
+        clusters.sort(key=lambda c: c["count"], reverse=True)
+
+        failures = [s for s in samples if s["error"]]
+        # 失敗はレイテンシが極端（即時エラー・タイムアウト）になりやすいため成功分のみで分布を取る
+        succeeded = [s for s in samples if not s["error"]]
+        latencies = sorted(s["latency"] for s in succeeded)
+        p50 = latencies[len(latencies) // 2] if latencies else 0.0
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0
+        outliers = sorted((s for s in succeeded if s["latency"] >= p95 and s["latency"] > p50),
+                          key=lambda s: s["latency"], reverse=True)
+        return {
+            "window": {
+                "requests_seen": self.seen,
+                "samples": len(samples),
+                "error_rate": len(failures) / len(samples),
+                "latency_p50": round(p50, 3),
+                "latency_p95": round(p95, 3),
+            },
+            "prompt_clusters": clusters[:self.top_clusters],
+            "failure_cases": [{"prompt": s["prompt"], "error": s["error"]} for s in failures[:self.max_examples]],
+            "latency_outliers": [{"prompt": s["prompt"], "latency": round(s["latency"], 3)} for s in outliers[:self.max_examples]],
+        }
+
+    async def maybe_run(self) -> Optional[Dict[str, Any]]:
+        """ウィンドウ条件を満たしていればevolution_crewを1回実行する（同時実行はしない）"""
+        if not self.window_ready() or self._lock.locked():
+            return None
+        async with self._lock:
+            if not self.window_ready():
+                return None
+            samples = list(self.samples)
+            seen = self.seen
+            digest = self.build_digest(samples)
+            self.samples.clear()
+            self.seen = 0
+            self.window_started = time.monotonic()
+            result = await self._run(digest)
+            if result is None:
+                self._restore(samples, seen)
+            else:
+                self._consecutive_failures = 0
+            return result
+
+    def _restore(self, samples: List[Dict[str, Any]], seen: int):
+        """
+        一時的な失敗のウィンドウの標本を、実行中に記録された標本の前に戻す（上限超過分は古い順に捨てる）。
+        再試行までの待ち時間は連続失敗ごとに倍増し、max_retry_secondsで頭打ちにする
+        """
+        restored: Deque[Dict[str, Any]] = deque(samples, maxlen=self.samples.maxlen)
+        restored.extend(self.samples)
+        self.samples = restored
+        self.seen += seen
+        self.failures += 1
+        self._consecutive_failures += 1
+        delay = min(self.retry_seconds * 2 ** (self._consecutive_failures - 1), self.max_retry_seconds)
+        self._retry_at = time.monotonic() + delay
+        logger.info(f"スケジュール進化の標本を戻しました（{len(self.samples)}件、{delay}秒後に再試行）")
+
+    @staticmethod
+    def _evolution_from_result(result) -> Dict[str, Any]:
+        output = getattr(result, "pydantic", None)
+        if not isinstance(output, EvolutionOutput):
+            # output_pydanticの変換に失敗した場合は前後の説明文を除いてrawのJSONを読む
+            raw = getattr(result, "raw", None) or ""
+            match = re.search(r"\{.*\}", raw, re.DOTALL)
+            output = EvolutionOutput(**json.loads(match.group(0) if match else raw))
+        return output.model_dump(by_alias=True, exclude_none=True)
+
+    async def _kickoff(self, digest: Dict[str, Any]):
+        # crewAIはcrew実行時にのみ必要（スケジューラ単体はcrewAIなしで動かせる）
+        from crews.generic_crew import kickoff_async_crew
+        return await kickoff_async_crew(
+            self.crew_name,
+            prompt=json.dumps(digest, ensure_ascii=False),
+            system_message="上記は個別の回答ではなく、直近ウィンドウのトラフィック全体のダイジェストです。"
+        )
+
+    async def _run(self, digest: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        evolution_crewを実行して適用する。一時的な失敗（再試行すべき）の場合のみNoneを返し、
+        出力不正・拒否の場合はウィンドウを破棄したものとしてstatus="dropped"の結果を返す
+        """
+        started = time.monotonic()
+        try:
+            result = await self._kickoff(digest)
+        except Exception as e:
+            logger.error(f"スケジュール進化の実行エラー（再試行します）: {e}")
+            return None
+        try:
+            evo = self._evolution_from_result(result)
+        except ValueError as e:
+            # JSONDecodeError・pydanticのValidationErrorはいずれもValueError
+            return await self._drop(digest, started, f"進化案の出力が不正: {e}")
+        try:
+            # 新規エージェント/タスクはバッチAIバリデーションを通してから1トランザクションで適用
+            applied = await apply_evolution_async(evo)
+        except (EvolutionValidationError, EvolutionConflictError) as e:
+            return await self._drop(digest, started, f"進化案が整合性検証で拒否: {e}")
+        except Exception as e:
+            logger.error(f"スケジュール進化の適用エラー（再試行します）: {e}")
+            return None
+        if applied["rejected"] and not applied["changed_files"]:
+            return await self._drop(digest, started, f"進化案が拒否: {[r['conflicts'] for r in applied['rejected']]}")
+        self.runs += 1
+        return await self._finish(digest, started, {
+            "status": "applied",
+            "generation": applied["generation"],
+            "changed_files": applied["changed_files"],
+        })
+
+    async def _drop(self, digest: Dict[str, Any], started: float, reason: str) -> Dict[str, Any]:
+        self.dropped += 1
+        logger.warning(f"スケジュール進化のウィンドウを破棄: {reason}")
+        return await self._finish(digest, started, {"status": "dropped", "reason": reason})
+
+    async def _finish(self, digest: Dict[str, Any], started: float, outcome: Dict[str, Any]) -> Dict[str, Any]:
+        self.last_run = {
+            "window": digest["window"],
+            "seconds": round(time.monotonic() - started, 3),
+            **outcome,
+        }
+        logger.info(f"スケジュール進化を実行: {self.last_run}")
+        await asyncio.to_thread(EvolutionTracker().record,
+                                {"type": "scheduled_evolution", "digest": digest, "result": self.last_run})
+        return self.last_run
+
+    async def run_forever(self, interval: float = 60.0):
+        """時間ウィンドウを満たしたかを定期的に確認するバックグラウンドループ"""
+        while True:
+            await asyncio.sleep(interval)
+            await self.maybe_run()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "pending_samples": len(self.samples),
+            "requests_seen": self.seen,
+            "window_age_seconds": round(time.monotonic() - self.window_started, 1),
+            "runs": self.runs,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "retry_in_seconds": round(max(0.0, self._retry_at - time.monotonic()), 1),
+            "last_run": self.last_run,
+        }
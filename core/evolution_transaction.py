@@ -0,0 +1,299 @@
+import os
+import copy
+import glob
+import json
+import stat
+import logging
+import tempfile
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+import yaml
+from filelock import FileLock
+from core.evolution_tracker import EvolutionTracker
+from utils.backup_and_rollback import backup_configs
+
+AGENTS_PATH = "config/agents/main_agents.yaml"
+TASKS_PATH = "config/tasks/main_tasks.yaml"
+CREWS_DIR = "config/crews"
+LOCK_PATH = "config/.evolution.lock"
+GENERATION_PATH = "config/evolution_generation.json"
+
+REQUIRED_AGENT_FIELDS = ["name", "goal", "role", "backstory"]
+
+class EvolutionConflictError(Exception):
+    """同一トランザクション内の進化案同士が矛盾している"""
+
+class EvolutionValidationError(Exception):
+    """適用後の設定が整合しない（未定義のagent/task参照など）"""
+
+def _atomic_write(path: str, dump):
+    """一時ファイルに書き出してからrenameし、読み手に書きかけのファイルを見せない"""
+    directory = os.path.dirname(os.path.abspath(path))
+    # *.yamlをglobする読み手に拾われないよう拡張子は.tmpにする
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        # mkstempは0600で作るため、既存ファイルのパーミッションを引き継ぐ（新規は0644）
+        mode = stat.S_IMODE(os.stat(path).st_mode) if os.path.exists(path) else 0o644
+        os.chmod(tmp_path, mode)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            dump(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def atomic_write_yaml(path: str, data: Any):
+    _atomic_write(path, lambda f: yaml.safe_dump(data, f, allow_unicode=True))
+
+def atomic_write_json(path: str, data: Any):
+    _atomic_write(path, lambda f: json.dump(data, f, ensure_ascii=False, indent=2))
+
+def _agent_key(agent: Any) -> Optional[str]:
+    if isinstance(agent, dict):
+        return agent.get("id") or agent.get("name")
+    if isinstance(agent, str):
+        return agent
+    return None
+
+def _canonical(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+
+class EvolutionTransaction:
+    """
+    複数の進化案をメモリ上でマージし、1回の検証・1ファイル1回のアトミック書き込みで適用する。
+    - add(): 進化案を積む（他の進化案と同じ対象を別内容で変更する場合や、積み済みの変更と合わせて
+      新たな参照切れを生む場合はその進化案ごと拒否）
+    - commit(): ロック下で最新YAMLを読み直して適用 → 整合性検証 → 変更ファイルのみtemp+renameで保存 → 世代番号を更新
+    値がNoneの変更は削除を表す。
+    """
+
+    def __init__(self, agents_path: str = AGENTS_PATH, tasks_path: str = TASKS_PATH,
+                 crews_path: str = CREWS_DIR, lock_path: str = LOCK_PATH,
+                 generation_path: str = GENERATION_PATH, backup: bool = True):
+        self.agents_path = agents_path
+        self.tasks_path = tasks_path
+        self.crews_path = crews_path
+        self.lock_path = lock_path
+        self.generation_path = generation_path
+        self.backup = backup
+        self.changes: Dict[Tuple[str, str], Any] = {}
+        self.accepted = 0
+        self.rejected: List[Dict[str, Any]] = []
+        # パス → ディスク上のYAML（存在しなければNone）。commit()ではロック取得後に読み直す
+        self._disk: Dict[str, Any] = {}
+        self._existing_errors: Optional[Set[str]] = None
+
+    # --- 進化案のステージング ---
+
+    @staticmethod
+    def _proposal_changes(evo: Dict[str, Any]) -> Dict[Tuple[str, str], Any]:
+        """進化案を (種別, キー) → 最終値 に正規化する（進化案内では後勝ち）"""
+        changes: Dict[Tuple[str, str], Any] = {}
+        for agent in evo.get("new_agents") or []:
+            key = _agent_key(agent) if isinstance(agent, dict) else None
+            if not key:
+                logging.warning(f"[警告] agent定義にid/nameがない、または不完全です: {agent}")
+                continue
+            agent = dict(agent)
+            # 不足属性を自動補完
+            for field in REQUIRED_AGENT_FIELDS:
+                agent.setdefault(field, "")
+            changes[("agent", key)] = agent
+        for agent in evo.get("remove_agents") or []:
+            key = _agent_key(agent)
+            if key:
+                changes[("agent", key)] = None
+        for merge in evo.get("merge_agents") or []:
+            if not isinstance(merge, dict) or not all(k in merge for k in ("from", "to", "definition")):
+                logging.warning(f"[警告] merge_agents定義が不完全です: {merge}")
+                continue
+            for agent_id in merge["from"]:
+                changes[("agent", agent_id)] = None
+            changes[("agent", merge["to"])] = merge["definition"]
+        for task in evo.get("new_tasks") or []:
+            if isinstance(task, dict) and task.get("id"):
+                changes[("task", task["id"])] = task
+            else:
+                logging.warning(f"[警告] task定義にidがありません: {task}")
+        for crew in evo.get("update_crews") or []:
+            if isinstance(crew, dict) and crew.get("name"):
+                updates = changes.get(("crew", crew["name"])) or {}
+                changes[("crew", crew["name"])] = {**updates, **crew}
+            else:
+                logging.warning(f"[警告] crew修正定義にnameがありません: {crew}")
+        return changes
+
+    def add(self, evo: Dict[str, Any]) -> bool:
+        """
+        進化案を積む。以下の場合はこの進化案全体を拒否してFalseを返す（同一内容の重複は許容）。
+        - 既に積まれた進化案と同じ対象を異なる内容で変更する
+        - 積まれた変更と合わせて適用すると、既存にはない参照切れ（削除されたagentをcrew/taskが参照する等）が生じる
+        """
+        proposal = self._proposal_changes(evo)
+        conflicts = [
+            f"{kind}:{key}" for (kind, key), value in proposal.items()
+            if (kind, key) in self.changes and _canonical(self.changes[(kind, key)]) != _canonical(value)
+        ]
+        if not conflicts:
+            conflicts = self._new_reference_errors({**self.changes, **proposal})
+        if conflicts:
+            logging.warning(f"進化案を拒否（他の進化案・既存設定と競合）: {conflicts}")
+            self.rejected.append({"proposal": evo, "conflicts": conflicts})
+            return False
+        self.changes.update(proposal)
+        self.accepted += 1
+        return True
+
+    def add_or_raise(self, evo: Dict[str, Any]):
+        if not self.add(evo):
+            raise EvolutionConflictError(self.rejected[-1]["conflicts"])
+
+    # --- 適用 ---
+
+    def _crew_file(self, crew_name: str) -> Optional[str]:
+        if os.path.isdir(self.crews_path):
+            path = os.path.join(self.crews_path, f"{crew_name}.yaml")
+            return path if os.path.exists(path) else None
+        return self.crews_path
+
+    @staticmethod
+    def _yaml_files(path: str) -> List[str]:
+        if os.path.isdir(path):
+            return sorted(glob.glob(os.path.join(path, "*.yaml")) + glob.glob(os.path.join(path, "*.yml")))
+        return [path] if os.path.exists(path) else []
+
+    def _read_yaml(self, path: str) -> Any:
+        """ディスク上のYAMLを返す（トランザクション内でキャッシュし、変更してよいコピーを返す）"""
+        if path not in self._disk:
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    self._disk[path] = yaml.safe_load(f) or {}
+            else:
+                self._disk[path] = None
+        return copy.deepcopy(self._disk[path])
+
+    def _apply(self, files: Dict[str, Any], changes: Optional[Dict[Tuple[str, str], Any]] = None):
+        def load(path):
+            if path not in files:
+                files[path] = self._read_yaml(path) or {}
+            return files[path]
+
+        for (kind, key), value in (self.changes if changes is None else changes).items():
+            if kind == "agent":
+                target = load(self.agents_path)
+            elif kind == "task":
+                target = load(self.tasks_path)
+            else:
+                crew_file = self._crew_file(key)
+                if crew_file is None:
+                    logging.warning(f"[警告] crewファイルが存在しません（修正スキップ）: {key}")
+                    continue
+                crews = load(crew_file)
+                crews[key] = {**(crews.get(key) or {}), **value}
+                continue
+            if value is None:
+                target.pop(key, None)
+            else:
+                target[key] = value
+
+    def _reference_errors(self, files: Dict[str, Any]) -> Set[str]:
+        """crew/taskが参照するagent・taskの未定義を列挙する"""
+        def merged(paths):
+            result = {}
+            for path in dict.fromkeys(paths):
+                result.update((files[path] if path in files else self._read_yaml(path)) or {})
+            return result
+
+        # agents/tasksは同じディレクトリのYAML全体、crewsはディレクトリ配下または単一ファイル
+        agents = merged(self._yaml_files(os.path.dirname(self.agents_path) or ".") + [self.agents_path])
+        tasks = merged(self._yaml_files(os.path.dirname(self.tasks_path) or ".") + [self.tasks_path])
+        crews = merged(self._yaml_files(self.crews_path) if os.path.isdir(self.crews_path) else [self.crews_path])
+        errors = set()
+        for task_id, task in tasks.items():
+            if isinstance(task, dict) and task.get("agent") and task["agent"] not in agents:
+                errors.add(f"task {task_id}: 未定義のagent {task['agent']}")
+        for crew_name, crew in crews.items():
+            if not isinstance(crew, dict):
+                continue
+            agent_ids = list(crew.get("agents") or [])
+            if crew.get("manager_agent"):
+                agent_ids.append(crew["manager_agent"])
+            for agent_id in agent_ids:
+                if agent_id not in agents:
+                    errors.add(f"crew {crew_name}: 未定義のagent {agent_id}")
+            for task_id in crew.get("tasks") or []:
+                if task_id not in tasks:
+                    errors.add(f"crew {crew_name}: 未定義のtask {task_id}")
+        return errors
+
+    def _new_reference_errors(self, changes: Dict[Tuple[str, str], Any]) -> List[str]:
+        """changesを適用した場合に、既存設定にはない参照切れを列挙する"""
+        files: Dict[str, Any] = {}
+        self._apply(files, changes)
+        if self._existing_errors is None:
+            self._existing_errors = self._reference_errors({})
+        return sorted(self._reference_errors(files) - self._existing_errors)
+
+    def _read_generation(self) -> int:
+        if not os.path.exists(self.generation_path):
+            return 0
+        with open(self.generation_path, encoding="utf-8") as f:
+            return json.load(f).get("generation", 0)
+
+    def commit(self) -> Dict[str, Any]:
+        """
+        積んだ進化案をまとめて適用する。検証NGの場合は何も書き込まずEvolutionValidationErrorを送出。
+        戻り値: {"generation", "changed_files", "accepted", "rejected"}
+        """
+        with FileLock(self.lock_path):
+            # add()以降に他プロセスが書き込んでいる可能性があるため、ロック下で読み直す
+            self._disk.clear()
+            self._existing_errors = None
+            files: Dict[str, Any] = {}
+            self._apply(files)
+            originals = {path: self._read_yaml(path) for path in files}
+            changed = [path for path, data in files.items()
+                       if _canonical(data) != _canonical(originals.get(path))]
+            generation = self._read_generation()
+            if changed:
+                # add()で進化案ごとに検証済み。ここではロック待ちの間の他プロセスの変更との組み合わせを最終確認する
+                # （既存の不整合は問わず、今回新たに生じたものだけを拒否する）
+                new_errors = self._reference_errors(files) - self._reference_errors({})
+                if new_errors:
+                    raise EvolutionValidationError(sorted(new_errors))
+                if self.backup:
+                    backup_configs()
+                for path in changed:
+                    atomic_write_yaml(path, files[path])
+                generation += 1
+                atomic_write_json(self.generation_path, {
+                    "generation": generation,
+                    "committed_at": datetime.utcnow().isoformat(),
+                    "changed_files": changed,
+                })
+        result = {
+            "generation": generation,
+            "changed_files": changed,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+        }
+        if changed:
+            logging.info(f"進化トランザクション適用: generation={generation}, files={changed}")
+            EvolutionTracker().record({
+                "type": "evolution_commit",
+                "generation": generation,
+                "changed_files": changed,
+                "accepted": self.accepted,
+                "rejected": [r["conflicts"] for r in self.rejected],
+            })
+        return result
+
+def apply_evolutions(evolutions: List[Dict[str, Any]], **kwargs) -> Dict[str, Any]:
+    """複数の進化案を1トランザクションで適用する"""
+    transaction = EvolutionTransaction(**kwargs)
+    for evo in evolutions:
+        transaction.add(evo)
+    return transaction.commit()
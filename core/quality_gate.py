@@ -0,0 +1,155 @@
+import json
+import re
+import time
+import logging
+import threading
+from typing import Any, Dict, Optional
+from utils.quality_models import QualityVerdict
+
+class QualityGateConfig:
+    """
+    crew YAMLの quality_gate 設定。
+    例:
+      quality_gate:
+        draft_task: main_task
+        feedback_task: main_feedback_task
+        revise_task: main_revise_task
+        threshold: 0.8
+        max_iterations: 2
+    """
+
+    def __init__(self, draft_task: str, feedback_task: str, revise_task: str,
+                 threshold: float = 0.8, max_iterations: int = 1):
+        self.draft_task = draft_task
+        self.feedback_task = feedback_task
+        self.revise_task = revise_task
+        self.threshold = float(threshold)
+        self.max_iterations = max(1, int(max_iterations))
+
+    @classmethod
+    def from_crew_config(cls, crew_config: Dict[str, Any]) -> Optional["QualityGateConfig"]:
+        conf = crew_config.get("quality_gate")
+        if not isinstance(conf, dict) or not conf.get("enabled", True):
+            return None
+        task_ids = crew_config.get("tasks") or []
+        for key in ("draft_task", "feedback_task", "revise_task"):
+            if conf.get(key) not in task_ids:
+                logging.warning(f"quality_gate.{key}がtasksに存在しません（品質ゲート無効）: {conf.get(key)}")
+                return None
+        return cls(
+            draft_task=conf["draft_task"],
+            feedback_task=conf["feedback_task"],
+            revise_task=conf["revise_task"],
+            threshold=conf.get("threshold", 0.8),
+            max_iterations=conf.get("max_iterations", 1),
+        )
+
+def extract_verdict(output) -> Optional[QualityVerdict]:
+    """TaskOutputからQualityVerdictを取り出す（output_pydantic失敗時はrawのJSONをパース）"""
+    if output is None:
+        return None
+    verdict = getattr(output, "pydantic", None)
+    if isinstance(verdict, QualityVerdict):
+        return verdict
+    raw = getattr(output, "raw", None) or ""
+    match = re.search(r"\{.*\}", raw, re.DOTALL)
+    if not match:
+        return None
+    try:
+        return QualityVerdict(**json.loads(match.group(0)))
+    except Exception as e:
+        logging.debug(f"品質評価のパース失敗: {e}")
+        return None
+
+class QualityGateRun:
+    """
+    1回のkickoffにおける品質ゲートの状態。
+    ConditionalTaskのconditionとTaskのcallbackとして使い、
+    採用すべき最終ドラフトとrevise実行/スキップ回数・所要時間を記録する。
+    """
+
+    def __init__(self, crew_name: str, config: QualityGateConfig):
+        self.crew_name = crew_name
+        self.config = config
+        self.final_output = None
+        self.last_verdict: Optional[QualityVerdict] = None
+        self.revisions_run = 0
+        self.revisions_skipped = 0
+        self.revise_seconds = 0.0
+        self._last_done = time.monotonic()
+
+    def mark_started(self):
+        self._last_done = time.monotonic()
+
+    def on_draft_done(self, output):
+        self.final_output = output
+        self._last_done = time.monotonic()
+
+    def on_feedback_done(self, output):
+        self.last_verdict = extract_verdict(output)
+        self._last_done = time.monotonic()
+
+    def on_revise_done(self, output):
+        now = time.monotonic()
+        self.revise_seconds += now - self._last_done
+        self._last_done = now
+        self.revisions_run += 1
+        if getattr(output, "raw", None):
+            self.final_output = output
+
+    def needs_revision(self, feedback_output) -> bool:
+        """
+        reviseのcondition: scoreがクルーごとのしきい値未満のときのみ実行
+        （passedはモデルの自己申告のため判定には使わず、しきい値を唯一の基準とする）
+        """
+        if not getattr(feedback_output, "raw", None):
+            # 直前のfeedbackがスキップ済み＝ループ終了
+            return False
+        verdict = extract_verdict(feedback_output)
+        if verdict is not None and verdict.score >= self.config.threshold:
+            self.revisions_skipped += 1
+            logging.info(f"[品質ゲート] {self.crew_name}: score={verdict.score:.2f} >= {self.config.threshold} のためreviseをスキップ")
+            return False
+        return True
+
+    def needs_feedback(self, revise_output) -> bool:
+        """2周目以降のfeedbackのcondition: 直前のreviseが実行された場合のみ再評価"""
+        return bool(getattr(revise_output, "raw", None))
+
+class QualityGateStats:
+    """クルーごとのrevise実行/スキップ率と削減レイテンシ（推定）を集計する"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, run: QualityGateRun):
+        with self._lock:
+            s = self._stats.setdefault(run.crew_name, {
+                "runs": 0,
+                "revisions_run": 0,
+                "revisions_skipped": 0,
+                "revise_seconds_total": 0.0,
+            })
+            s["runs"] += 1
+            s["revisions_run"] += run.revisions_run
+            s["revisions_skipped"] += run.revisions_skipped
+            s["revise_seconds_total"] += run.revise_seconds
+        logging.info(f"[品質ゲート] {run.crew_name}: {self.snapshot().get(run.crew_name)}")
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            result = {}
+            for crew_name, s in self._stats.items():
+                decisions = s["revisions_run"] + s["revisions_skipped"]
+                avg_revise = s["revise_seconds_total"] / s["revisions_run"] if s["revisions_run"] else 0.0
+                result[crew_name] = {
+                    **s,
+                    "skip_rate": s["revisions_skipped"] / decisions if decisions else 0.0,
+                    "avg_revise_seconds": avg_revise,
+                    # スキップ1回あたり平均revise時間を削減したとみなす
+                    "latency_saved_seconds": avg_revise * s["revisions_skipped"],
+                }
+            return result
+
+quality_gate_stats = QualityGateStats()
@@ -0,0 +1,93 @@
+import random
+import hashlib
+from typing import Dict, Iterable, List, Set, Tuple
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+class MinHashIndex:
+    """
+    文字n-gram（shingle）のMinHash＋LSHによる近似重複インデックス。
+    日本語の定義文でも分かち書き不要で類似度（推定Jaccard係数）を求められる。
+    """
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, shingle_size: int = 3, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_permはbandsで割り切れる必要があります")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = random.Random(seed)
+        self._perms = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(num_perm)]
+        self._signatures: Dict[str, Tuple[int, ...]] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[str]] = {}
+
+    def _shingles(self, text: str) -> Set[str]:
+        normalized = "".join(text.split()).lower()
+        n = self.shingle_size
+        if len(normalized) <= n:
+            return {normalized} if normalized else set()
+        return {normalized[i:i + n] for i in range(len(normalized) - n + 1)}
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        hashes = [
+            int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") % _MERSENNE_PRIME
+            for s in self._shingles(text)
+        ]
+        if not hashes:
+            return tuple([_MERSENNE_PRIME] * self.num_perm)
+        return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in self._perms)
+
+    def _band_keys(self, sig: Tuple[int, ...]):
+        for band in range(self.bands):
+            yield band, sig[band * self.rows:(band + 1) * self.rows]
+
+    @staticmethod
+    def similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+        return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+    def add(self, key: str, text: str):
+        self.remove(key)
+        sig = self.signature(text)
+        self._signatures[key] = sig
+        for band_key in self._band_keys(sig):
+            self._buckets.setdefault(band_key, set()).add(key)
+
+    def remove(self, key: str):
+        sig = self._signatures.pop(key, None)
+        if sig is None:
+            return
+        for band_key in self._band_keys(sig):
+            bucket = self._buckets.get(band_key)
+            if bucket:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def _candidates(self, sig: Tuple[int, ...]) -> Set[str]:
+        keys: Set[str] = set()
+        for band_key in self._band_keys(sig):
+            keys |= self._buckets.get(band_key, set())
+        return keys
+
+    def query(self, text: str, threshold: float) -> List[Tuple[str, float]]:
+        """LSH候補のうち推定類似度がthreshold以上のものを類似度降順で返す"""
+        sig = self.signature(text)
+        scored = [(key, self.similarity(sig, self._signatures[key])) for key in self._candidates(sig)]
+        return sorted((s for s in scored if s[1] >= threshold), key=lambda s: s[1], reverse=True)
+
+    def most_similar(self, text: str, k: int, exclude: Iterable[str] = ()) -> List[Tuple[str, float]]:
+        """類似度上位k件を返す（LSH候補がk件未満なら全署名から補完）"""
+        sig = self.signature(text)
+        exclude = set(exclude)
+        keys = self._candidates(sig) - exclude
+        if len(keys) < k:
+            keys = self._signatures.keys() - exclude
+        scored = [(key, self.similarity(sig, self._signatures[key])) for key in keys]
+        return sorted(scored, key=lambda s: s[1], reverse=True)[:k]
+
+    def keys(self):
+        return self._signatures.keys()
+
+    def __len__(self):
+        return len(self._signatures)
@@ -1,71 +1,221 @@
+import re
+import json
+import hashlib
 import yaml
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import logging
 from core.evolution_tracker import EvolutionTracker
-from crews.generic_crew import kickoff_async_crew
+from core.similarity_index import MinHashIndex
+
+AGENT_EXACT_FIELDS = ["name", "role", "goal", "tools"]
+AGENT_TEXT_FIELDS = ["role", "goal", "backstory"]
+TASK_EXACT_FIELDS = ["description", "expected_output"]
+TASK_TEXT_FIELDS = ["description", "expected_output"]
+VALIDATION_CREW = "validation_crew"
+# utils.evolution_models.AgentDefinitionの必須属性（id/nameはどちらか一方をキーとして使う）
+AGENT_REQUIRED_FIELDS = ["role", "goal", "backstory"]
+
+def _fingerprint(definition: Dict[str, Any], fields: List[str]) -> str:
+    payload = json.dumps([definition.get(f) for f in fields], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def _text(definition: Dict[str, Any], fields: List[str]) -> str:
+    return "\n".join(str(definition.get(f) or "") for f in fields)
+
+def _agent_key(agent: Dict[str, Any]) -> Optional[str]:
+    """EvolutionTransactionと同じく、idがなければnameをエージェントのキーとする"""
+    return agent.get("id") or agent.get("name")
 
 class YAMLValidator:
-    def __init__(self, agents: Dict[str, Any], tasks: Dict[str, Any]):
+    def __init__(self, agents: Dict[str, Any], tasks: Dict[str, Any],
+                 near_duplicate_threshold: float = 0.9, similar_k: int = 3):
         self.agents = agents
         self.tasks = tasks
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.similar_k = similar_k
         self.evolution_tracker = EvolutionTracker()
+        # 完全一致用ハッシュインデックスと近似重複用MinHashインデックス
+        self._agent_hashes: Dict[str, str] = {}
+        self._task_hashes: Dict[str, str] = {}
+        self._agent_similarity = MinHashIndex()
+        self._task_similarity = MinHashIndex()
+        self._pending_agent_ids = set()
+        for agent_id, agent in self.agents.items():
+            self.index_agent(agent_id, agent)
+        for task_id, task in self.tasks.items():
+            self.index_task(task_id, task)
+
+    def index_agent(self, agent_id: str, agent: Dict[str, Any]):
+        self._agent_hashes[_fingerprint(agent, AGENT_EXACT_FIELDS)] = agent_id
+        self._agent_similarity.add(agent_id, _text(agent, AGENT_TEXT_FIELDS))
+
+    def unindex_agent(self, agent_id: str, agent: Dict[str, Any]):
+        fingerprint = _fingerprint(agent, AGENT_EXACT_FIELDS)
+        if self._agent_hashes.get(fingerprint) == agent_id:
+            del self._agent_hashes[fingerprint]
+        self._agent_similarity.remove(agent_id)
+
+    def index_task(self, task_id: str, task: Dict[str, Any]):
+        self._task_hashes[_fingerprint(task, TASK_EXACT_FIELDS)] = task_id
+        self._task_similarity.add(task_id, _text(task, TASK_TEXT_FIELDS))
 
     def is_duplicate_agent(self, new_agent: Dict[str, Any]) -> bool:
-        for agent_id, agent in self.agents.items():
-            if agent_id == new_agent.get("id"):
-                return True
-            if (agent.get("name") == new_agent.get("name") and
-                agent.get("role") == new_agent.get("role") and
-                agent.get("goal") == new_agent.get("goal") and
-                agent.get("tools") == new_agent.get("tools")):
-                return True
-        return False
+        key = _agent_key(new_agent)
+        if key in self.agents or key in self._pending_agent_ids:
+            return True
+        return _fingerprint(new_agent, AGENT_EXACT_FIELDS) in self._agent_hashes
 
     def is_duplicate_task(self, new_task: Dict[str, Any]) -> bool:
-        for task_id, task in self.tasks.items():
-            if task_id == new_task.get("id"):
-                return True
-            if (task.get("description") == new_task.get("description") and
-                task.get("expected_output") == new_task.get("expected_output")):
-                return True
-        return False
+        if new_task.get("id") in self.tasks:
+            return True
+        return _fingerprint(new_task, TASK_EXACT_FIELDS) in self._task_hashes
 
-    async def ai_validate_agent(self, new_agent: Dict[str, Any]) -> bool:
-        # 既存エージェント一覧をsystem_messageとして渡す
-        system_message = str(list(self.agents.values()))
+    def find_near_duplicate_agent(self, new_agent: Dict[str, Any]) -> Optional[str]:
+        """role/goal/backstoryの推定類似度がしきい値以上の既存エージェントIDを返す"""
+        matches = self._agent_similarity.query(_text(new_agent, AGENT_TEXT_FIELDS), self.near_duplicate_threshold)
+        return matches[0][0] if matches else None
+
+    def find_near_duplicate_task(self, new_task: Dict[str, Any]) -> Optional[str]:
+        """description/expected_outputの推定類似度がしきい値以上の既存タスクIDを返す"""
+        matches = self._task_similarity.query(_text(new_task, TASK_TEXT_FIELDS), self.near_duplicate_threshold)
+        return matches[0][0] if matches else None
+
+    def similar_agents(self, new_agent: Dict[str, Any], k: Optional[int] = None) -> Dict[str, Any]:
+        """類似度上位k件の既存エージェント定義を返す（AIバリデーションの比較対象）"""
+        top = self._agent_similarity.most_similar(_text(new_agent, AGENT_TEXT_FIELDS), k or self.similar_k,
+                                                  exclude=self._pending_agent_ids)
+        return {agent_id: self.agents[agent_id] for agent_id, _ in top if agent_id in self.agents}
+
+    def _rule_validate_agent(self, agent: Dict[str, Any]) -> bool:
+        if not _agent_key(agent) or not all(agent.get(k) for k in AGENT_REQUIRED_FIELDS):
+            return False
+        if self.is_duplicate_agent(agent):
+            return False
+        near = self.find_near_duplicate_agent(agent)
+        if near:
+            logging.info(f"近似重複エージェント: {_agent_key(agent)} ≈ {near}")
+            return False
+        return True
+
+    async def ai_validate_agents(self, new_agents: List[Dict[str, Any]]) -> List[bool]:
+        """
+        候補エージェントをまとめて1回のvalidation_crew実行で判定する。
+        既存定義は全件ではなく、各候補に類似する上位k件のみを渡す。
+        """
+        if not new_agents:
+            return []
+        # ルール検証・インデックスはcrewAIなしでも使えるよう、crew実行部分のみ遅延import
+        from crews.generic_crew import kickoff_async_crew, crews_yaml
+        candidates = [{"index": i, "definition": agent} for i, agent in enumerate(new_agents)]
+        related: Dict[str, Any] = {}
+        for agent in new_agents:
+            related.update(self.similar_agents(agent))
         result = await kickoff_async_crew(
-            "validation_crew",
-            prompt=str(new_agent),
-            system_message=system_message
+            VALIDATION_CREW,
+            prompt=json.dumps(candidates, ensure_ascii=False, default=str),
+            system_message=json.dumps(related, ensure_ascii=False, default=str)
         )
         # ログ・進化履歴に記録
         logging.info(f"AIバリデーション結果: {result}")
         self.evolution_tracker.record({
             "type": "ai_validation",
             "target": "agent",
-            "input": new_agent,
+            "input": new_agents,
             "result": str(result)
         })
-        # AIの返答がdict形式で返る前提
-        if hasattr(result, "raw"):
-            import json
-            try:
-                ai_result = json.loads(result.raw)
-                return not ai_result.get("is_duplicate", False)
-            except Exception as e:
-                logging.error(f"AIバリデーションのパース失敗: {e}, result={result}")
-                return True  # パース失敗時は重複扱い
-        return True
+        gate = crews_yaml.get(VALIDATION_CREW, {}).get("quality_gate") or {}
+        for raw in self._verdict_candidates(result, gate.get("revise_task")):
+            verdicts = self._parse_validation_results(raw, len(new_agents))
+            if verdicts is not None:
+                return verdicts
+        # 判定結果が読めない場合は全候補を不合格扱い（未検証のエージェントは書き込まない）
+        logging.error(f"AIバリデーションのパース失敗のため全候補を不合格にします: result={result}")
+        return [False] * len(new_agents)
+
+    @staticmethod
+    def _verdict_candidates(result, revise_task: Optional[str]) -> List[Optional[str]]:
+        """
+        判定結果として読む出力の候補（優先順）。
+        reviseが実行された場合は初回判定がfeedbackで不合格になっているため、最終出力のみを使う。
+        reviseがスキップされた（ConditionalTaskの出力が空）場合のみ初回判定（validate_agent_task）も使う。
+        """
+        raws = [getattr(result, "raw", None)]
+        tasks_output = getattr(result, "tasks_output", None) or []
+        revised = any(getattr(o, "name", None) == revise_task and getattr(o, "raw", None)
+                      for o in tasks_output)
+        if tasks_output and not revised:
+            raws.append(getattr(tasks_output[0], "raw", None))
+        return raws
+
+    @staticmethod
+    def _parse_validation_results(raw: Optional[str], count: int) -> Optional[List[bool]]:
+        """
+        results配列のJSONを候補ごとの合否に変換する。読めなければNone。
+        is_duplicateが真偽値のfalseである候補のみ合格とし、言及のない候補・不正な要素・
+        同じindexで1度でも重複と判定された候補は不合格にする
+        """
+        if not raw:
+            return None
+        match = re.search(r"\{.*\}", raw, re.DOTALL)
+        try:
+            ai_result = json.loads(match.group(0) if match else raw)
+        except Exception as e:
+            logging.debug(f"AIバリデーション結果のJSONパース失敗: {e}")
+            return None
+        items = ai_result.get("results") if isinstance(ai_result, dict) else None
+        if not isinstance(items, list):
+            return None
+        verdicts = [False] * count
+        rejected = set()
+        for item in items:
+            index = item.get("index") if isinstance(item, dict) else None
+            if not isinstance(index, int) or isinstance(index, bool) or not 0 <= index < count:
+                continue
+            if item.get("is_duplicate") is False and index not in rejected:
+                verdicts[index] = True
+            else:
+                verdicts[index] = False
+                rejected.add(index)
+        return verdicts
+
+    async def ai_validate_agent(self, new_agent: Dict[str, Any]) -> bool:
+        return (await self.ai_validate_agents([new_agent]))[0]
+
+    async def validate_agents(self, agents: List[Dict[str, Any]]) -> List[bool]:
+        """
+        進化案に含まれる複数エージェントを一括検証する。
+        ルール検証（必須キー・完全一致・近似重複、候補同士の重複含む）を通過したものだけを
+        1回のAIバリデーションにかける。
+        """
+        results = [False] * len(agents)
+        passed = []
+        for i, agent in enumerate(agents):
+            if self._rule_validate_agent(agent):
+                passed.append(i)
+                # 同一進化案内の候補同士の重複も検出できるよう仮登録
+                self.index_agent(_agent_key(agent), agent)
+                self._pending_agent_ids.add(_agent_key(agent))
+        try:
+            if passed:
+                ai_results = await self.ai_validate_agents([agents[i] for i in passed])
+                for i, ok in zip(passed, ai_results):
+                    results[i] = ok
+        finally:
+            for i in passed:
+                if not results[i]:
+                    self.unindex_agent(_agent_key(agents[i]), agents[i])
+            self._pending_agent_ids.clear()
+        return results
 
     async def validate_agent(self, agent: Dict[str, Any]) -> bool:
-        # 単一YAMLのdict構造に合わせて必須キーを確認
-        required = ["id", "name", "role", "goal", "tools"]
-        rule_valid = all(k in agent for k in required) and not self.is_duplicate_agent(agent)
-        if not rule_valid:
-            return False
-        # AIバリデーションも併用
-        return await self.ai_validate_agent(agent)
+        return (await self.validate_agents([agent]))[0]
 
     def validate_task(self, task: Dict[str, Any]) -> bool:
         required = ["id", "description", "agent"]
-        return all(k in task for k in required) and not self.is_duplicate_task(task) 
\ No newline at end of file
+        if not all(k in task for k in required) or self.is_duplicate_task(task):
+            return False
+        near = self.find_near_duplicate_task(task)
+        if near:
+            logging.info(f"近似重複タスク: {task.get('id')} ≈ {near}")
+            return False
+        return True
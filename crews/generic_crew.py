@@ -1,22 +1,21 @@
 import os
 import json
 import logging
-import traceback
+import importlib
 from crewai import Agent, Task, Crew, LLM
+from crewai.tasks.conditional_task import ConditionalTask
+from crewai.crews.crew_output import CrewOutput
+from crewai.utilities.events import crewai_event_bus, TaskStartedEvent
 from utils.yaml_loader import load_yaml
 from tools.monica_llm import MonicaLLM
+from tools.web_fetch import SEACOR_TOOLS
+from core.quality_gate import QualityGateConfig, QualityGateRun, quality_gate_stats
+from utils.log_pipeline import LazyJSON, log_context, task_var
 # crewai_tools系ツールをimport
 from crewai_tools import BraveSearchTool, ScrapeWebsiteTool, SpiderTool
 
-# ログ設定（ファイルにも出力）
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s %(levelname)s %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('/app/logs/generic_crew_debug.log', encoding='utf-8')
-    ]
-)
+# ログ出力先・レベルはutils.log_pipeline.setup_logging()で一元設定する
+logger = logging.getLogger(__name__)
 
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 AGENT_DIR = os.path.join(BASE_DIR, "config", "agents")
@@ -29,10 +28,15 @@ tasks_yaml = load_yaml(TASK_DIR)
 crews_yaml = load_yaml(CREW_DIR)
 tools_yaml = load_yaml(TOOLS_PATH)
 
-print("[DEBUG] agents_yaml:", json.dumps(agents_yaml, ensure_ascii=False, indent=2))
-print("[DEBUG] tasks_yaml:", json.dumps(tasks_yaml, ensure_ascii=False, indent=2))
-print("[DEBUG] crews_yaml:", json.dumps(crews_yaml, ensure_ascii=False, indent=2))
-print("[DEBUG] tools_yaml:", json.dumps(tools_yaml, ensure_ascii=False, indent=2))
+logger.debug("agents_yaml: %s", LazyJSON(agents_yaml))
+logger.debug("tasks_yaml: %s", LazyJSON(tasks_yaml))
+logger.debug("crews_yaml: %s", LazyJSON(crews_yaml))
+logger.debug("tools_yaml: %s", LazyJSON(tools_yaml))
+
+@crewai_event_bus.on(TaskStartedEvent)
+def _bind_task_log_context(source, event):
+    # タスク実行スレッド内のログにtask IDを付与する
+    task_var.set(getattr(source, "name", None))
 
 #monica_llm = MonicaLLM();
 monica_llm = LLM(
@@ -48,13 +52,14 @@ class DynamicCrewBuilder:
         self.crew_name = crew_name
         self.prompt = prompt
         self.system_message = system_message
+        self.quality_gate_run = None
         try:
             self.crew_config = crews_yaml[crew_name].copy()
         except Exception as e:
-            print(f"[ERROR] crew_name={crew_name} の取得に失敗: {e}")
-            traceback.print_exc()
+            logger.exception(f"crew_name={crew_name} の取得に失敗: {e}")
             raise
-        print(f"[DEBUG] crew_config: {json.dumps(self.crew_config, ensure_ascii=False, indent=2)}")
+        # crew_configはbuild_crewで書き換えるため、整形時点ではなくこの時点のスナップショットを渡す
+        logger.debug("crew_config: %s", LazyJSON(dict(self.crew_config)))
     
     def process_config(self, conf):
         """configの型チェックと変換"""
@@ -74,8 +79,7 @@ class DynamicCrewBuilder:
         try:
             conf = agents_yaml[agent_id].copy()
         except Exception as e:
-            print(f"[ERROR] agent_id={agent_id} の取得に失敗: {e}")
-            traceback.print_exc()
+            logger.exception(f"agent_id={agent_id} の取得に失敗: {e}")
             raise
         if no_tools:
             conf["tools"] = []
@@ -94,11 +98,18 @@ class DynamicCrewBuilder:
                             elif class_name == "SpiderTool":
                                 tool_objs.append(SpiderTool())
                             else:
-                                logging.warning(f"未対応のcrewai_tools: {class_name}")
+                                logger.warning(f"未対応のcrewai_tools: {class_name}")
+                        elif tool_conf.get("provider") == "seacor":
+                            tool_cls = SEACOR_TOOLS.get(tool_conf.get("class"))
+                            if tool_cls:
+                                engine_options = tools_yaml.get("fetch_engine", {}).get("options", {})
+                                tool_objs.append(tool_cls(engine_options=engine_options, **tool_conf.get("options", {})))
+                            else:
+                                logger.warning(f"未対応のseacorツール: {tool_conf.get('class')}")
                         else:
-                            logging.warning(f"未対応のprovider: {tool_conf.get('provider')}")
+                            logger.warning(f"未対応のprovider: {tool_conf.get('provider')}")
                     else:
-                        logging.warning(f"tools_yamlに未定義: {t}")
+                        logger.warning(f"tools_yamlに未定義: {t}")
                 else:
                     tool_objs.append(t)
             conf["tools"] = tool_objs
@@ -110,46 +121,79 @@ class DynamicCrewBuilder:
         return Agent(**conf)
 
     def build_task(self, task_id: str, prompt: str = None, 
-                  main_task_output: str = None, system_message: str = None) -> Task:
-        """動的にタスクを構築"""
+                  main_task_output: str = None, system_message: str = None,
+                  condition=None, callback=None) -> Task:
+        """動的にタスクを構築（conditionを渡すとConditionalTaskになる）"""
         try:
             conf = tasks_yaml[task_id].copy()
         except Exception as e:
-            print(f"[ERROR] task_id={task_id} の取得に失敗: {e}")
-            traceback.print_exc()
+            logger.exception(f"task_id={task_id} の取得に失敗: {e}")
             raise
         conf = self.process_config(conf)
-        # output_pydanticのクラス変換
+        # ログのtask IDとして使う
+        conf.setdefault("name", task_id)
+        # output_pydanticのクラス変換（"module.ClassName"形式）
         if "output_pydantic" in conf and isinstance(conf["output_pydantic"], str):
-            if conf["output_pydantic"] == "utils.evolution_models.EvolutionOutput":
-                try:
-                    from utils.evolution_models import EvolutionOutput
-                    conf["output_pydantic"] = EvolutionOutput
-                except Exception as e:
-                    print(f"[ERROR] output_pydanticクラスimport失敗: {e}")
-                    conf["output_pydantic"] = None
+            try:
+                module_name, class_name = conf["output_pydantic"].rsplit(".", 1)
+                conf["output_pydantic"] = getattr(importlib.import_module(module_name), class_name)
+            except Exception as e:
+                logger.error(f"output_pydanticクラスimport失敗: {e}")
+                conf["output_pydantic"] = None
+        if callback is not None:
+            conf["callback"] = callback
+        if condition is not None:
+            return ConditionalTask(condition=condition, **conf)
         return Task(**conf)
 
+    def build_tasks(self, task_ids):
+        """
+        タスク一覧を構築。quality_gate設定がある場合は
+        draft → feedback → revise(条件付き) → [feedback(条件付き) → revise(条件付き)] × (max_iterations-1)
+        に展開し、評価がしきい値を超えた時点でreviseをスキップする。
+        """
+        gate = QualityGateConfig.from_crew_config(self.crew_config)
+        if gate is None:
+            return [self.build_task(tid, self.prompt, system_message=self.system_message) for tid in task_ids]
+        run = QualityGateRun(self.crew_name, gate)
+        self.quality_gate_run = run
+        tasks = []
+        for tid in task_ids:
+            if tid == gate.draft_task:
+                tasks.append(self.build_task(tid, self.prompt, system_message=self.system_message,
+                                             callback=run.on_draft_done))
+            elif tid == gate.feedback_task:
+                for i in range(gate.max_iterations):
+                    tasks.append(self.build_task(gate.feedback_task, self.prompt, system_message=self.system_message,
+                                                 condition=run.needs_feedback if i > 0 else None,
+                                                 callback=run.on_feedback_done))
+                    tasks.append(self.build_task(gate.revise_task, self.prompt, system_message=self.system_message,
+                                                 condition=run.needs_revision,
+                                                 callback=run.on_revise_done))
+            elif tid != gate.revise_task:
+                tasks.append(self.build_task(tid, self.prompt, system_message=self.system_message))
+        return tasks
+
     def build_crew(self) -> Crew:
         """動的にクルーを構築"""
-        print(f"[DEBUG] build_crew crew_config: {json.dumps(self.crew_config, ensure_ascii=False, indent=2)}")
+        logger.debug("build_crew crew_config: %s", LazyJSON(dict(self.crew_config)))
         agent_ids = self.crew_config.get("agents")
         task_ids = self.crew_config.get("tasks")
         if not agent_ids or not task_ids:
             raise ValueError(f"crew_configに'agents'または'tasks'キーがありません: {self.crew_config}")
-        print(f"[DEBUG] build_crew agent_ids: {agent_ids}")
-        print(f"[DEBUG] build_crew task_ids: {task_ids}")
+        logger.debug("build_crew agent_ids: %s", agent_ids)
+        logger.debug("build_crew task_ids: %s", task_ids)
         # 直接crew_configに代入
         self.crew_config["agents"] = [self.build_agent(aid) for aid in agent_ids]
-        self.crew_config["tasks"] = [self.build_task(tid, self.prompt, system_message=self.system_message) for tid in task_ids]
+        self.crew_config["tasks"] = self.build_tasks(task_ids)
         # マネージャーエージェントの処理
         if "manager_agent" in self.crew_config:
             self.crew_config["manager_agent"] = self.build_agent(
                 self.crew_config["manager_agent"], 
                 no_tools=True
             )
-        print(f"[DEBUG] build_crew agents: {self.crew_config['agents']}")
-        print(f"[DEBUG] build_crew tasks: {self.crew_config['tasks']}")
+        logger.debug("build_crew agents: %s", self.crew_config["agents"])
+        logger.debug("build_crew tasks: %s", self.crew_config["tasks"])
 
         if self.crew_config.get("planning_llm") == "monica_llm":
             self.crew_config["planning_llm"] = monica_llm
@@ -157,22 +201,39 @@ class DynamicCrewBuilder:
             self.crew_config["manager_llm"] = monica_llm
         if self.crew_config.get("function_calling_llm") == "monica_llm":
             self.crew_config["function_calling_llm"] = monica_llm
+        # crewAIに渡さない独自設定
+        self.crew_config.pop("quality_gate", None)
+        self.crew_config.pop("schedule", None)
 
         try:
             return Crew(**self.crew_config)
         except Exception as e:
-            print("[ERROR] Crew生成時例外:", e)
-            traceback.print_exc()
+            logger.exception(f"Crew生成時例外: {e}")
             raise
 
 async def kickoff_async_crew(crew_name: str, prompt: str, system_message: str = ""):
     """非同期でクルーを実行"""
-    try:
-        builder = DynamicCrewBuilder(crew_name, prompt, system_message)
-        crew = builder.build_crew()
-        result = await crew.kickoff_async(inputs={"prompt": prompt, "system_message": system_message})
-        return result
-    except Exception as e:
-        print(f"[ERROR] kickoff_async_crew例外: {e}")
-        traceback.print_exc()
-        raise 
\ No newline at end of file
+    with log_context(crew=crew_name):
+        try:
+            builder = DynamicCrewBuilder(crew_name, prompt, system_message)
+            crew = builder.build_crew()
+            run = builder.quality_gate_run
+            if run is not None:
+                run.mark_started()
+            result = await crew.kickoff_async(inputs={"prompt": prompt, "system_message": system_message})
+            if run is not None:
+                quality_gate_stats.record(run)
+                # reviseがスキップされた場合、最後のtask出力は評価結果なので採用ドラフトに差し替える
+                final = run.final_output
+                if final is not None and final.raw != result.raw:
+                    result = CrewOutput(
+                        raw=final.raw,
+                        pydantic=final.pydantic,
+                        json_dict=final.json_dict,
+                        tasks_output=result.tasks_output,
+                        token_usage=result.token_usage,
+                    )
+            return result
+        except Exception as e:
+            logger.exception(f"kickoff_async_crew例外: {e}")
+            raise
@@ -3,20 +3,23 @@ from fastapi import FastAPI, Request, BackgroundTasks
 from fastapi.responses import JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 import os
+import time
+import uuid
+import asyncio
 import logging
 from dotenv import load_dotenv
 import debugpy
+from utils.log_pipeline import setup_logging, request_id_var
 
-from crews.generic_crew import kickoff_async_crew
-from utils.yaml_loader import reencode_json_to_utf8
-
+# crew系モジュールはimport時にログを出すため、.env読み込みとログ設定を先に行う
 load_dotenv()
-LOG_FILE = os.environ.get("LOG_FILE", "logs/task.log")
-logging.basicConfig(
-    filename=LOG_FILE,
-    level=getattr(logging, os.getenv("SEACOR_LOG_LEVEL", "INFO")),
-    format='%(asctime)s %(levelname)s %(name)s %(message)s'
-)
+# キュー経由のバックグラウンド書き込み（LOG_FILE, SEACOR_LOG_LEVEL, SEACOR_LOG_LEVELS, SEACOR_DEBUG_SAMPLE_RATE）
+setup_logging()
+
+from crews.generic_crew import kickoff_async_crew, crews_yaml
+from core.quality_gate import quality_gate_stats
+from core.evolution_scheduler import EvolutionScheduler
+from utils.yaml_loader import reencode_json_to_utf8
 
 def enable_debug():
     """デバッグモードを有効化"""
@@ -33,6 +36,14 @@ if os.getenv("PYTHONBREAKPOINT") == "0":
 
 app = FastAPI()
 
+# evolution_crewはリクエストごとではなく、標本化したトラフィックのウィンドウ単位で実行する
+evolution_scheduler = EvolutionScheduler.from_crew_config(crews_yaml.get("evolution_crew", {}))
+
+@app.on_event("startup")
+async def start_evolution_scheduler():
+    # 時間ウィンドウの判定用（件数ウィンドウは各リクエスト後に判定）
+    app.state.evolution_scheduler_task = asyncio.create_task(evolution_scheduler.run_forever())
+
 # publicディレクトリのパス
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PUBLIC_DIR = os.path.join(BASE_DIR, "public")
@@ -43,6 +54,18 @@ os.makedirs("logs", exist_ok=True)
 # 静的ファイルを/staticでマウント
 app.mount("/static", StaticFiles(directory=PUBLIC_DIR, html=True), name="static")
 
+@app.middleware("http")
+async def bind_request_id(request: Request, call_next):
+    """リクエストごとの相関IDをログに付与する（X-Request-IDがあれば引き継ぐ）"""
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
 @app.post("/v1/chat/completions")
 async def chat_completions(request: Request, background_tasks: BackgroundTasks):
     """
@@ -58,10 +81,11 @@ async def chat_completions(request: Request, background_tasks: BackgroundTasks):
       "max_tokens": 2000
     }
     """
+    started = time.monotonic()
+    prompt = ""
     try:
         data = await request.json()
         messages = data.get("messages", [])
-        prompt = ""
         system_message = ""
         
         # OpenAI互換: system, user, assistantのroleを考慮
@@ -77,30 +101,10 @@ async def chat_completions(request: Request, background_tasks: BackgroundTasks):
         main_final_answer = getattr(main_result, "raw", str(main_result))
         reencode_json_to_utf8("logs/main_crew.json")
 
-        # evolution_crew, flow_review_crewはバックグラウンドで実行
-        # async def run_background_crews(main_final_answer: str, prompt: str):
-        #     try:
-        #         # evolution_crewの実行
-        #         evolution_result = await kickoff_async_crew(
-        #             "evolution_crew", 
-        #             prompt, 
-        #             system_message=main_final_answer
-        #         )
-        #         reencode_json_to_utf8("logs/evolution_crew.json")
-                
-        #         # flow_review_crewの実行
-        #         flow_review_result = await kickoff_async_crew(
-        #             "flow_review_crew", 
-        #             prompt, 
-        #             system_message=main_final_answer
-        #         )
-        #         reencode_json_to_utf8("logs/flow_review_crew.json")
-                
-        #     except Exception as e:
-        #         logging.error(f"バックグラウンドクルー実行エラー: {e}")
-
-        # # バックグラウンドタスクとして実行
-        # background_tasks.add_task(run_background_crews, main_final_answer, prompt)
+        # 進化用の標本として記録し、ウィンドウが満ちていればバックグラウンドでevolution_crewを1回実行
+        evolution_scheduler.record(prompt.strip(), main_final_answer, time.monotonic() - started,
+                                   request_id=request_id_var.get())
+        background_tasks.add_task(evolution_scheduler.maybe_run)
 
         # main_crewの出力のみを返す
         content = main_final_answer
@@ -129,6 +133,8 @@ async def chat_completions(request: Request, background_tasks: BackgroundTasks):
         
     except Exception as e:
         logging.error(f"chat_completionsエラー: {e}")
+        evolution_scheduler.record(prompt.strip(), latency=time.monotonic() - started, error=str(e),
+                                   request_id=request_id_var.get())
         return JSONResponse(
             status_code=500,
             content={"error": str(e)}
@@ -142,5 +148,15 @@ def root():
 def health():
     return {"status": "ok"}
 
+@app.get("/stats/evolution")
+def evolution_stats_view():
+    """スケジュール進化の標本数・ウィンドウ経過・直近実行結果"""
+    return evolution_scheduler.snapshot()
+
+@app.get("/stats/quality_gate")
+def quality_gate_stats_view():
+    """クルーごとのreviseスキップ率・削減レイテンシ（推定）"""
+    return quality_gate_stats.snapshot()
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=False)  # デバッグモードとの競合を避けるためreload=False 
\ No newline at end of file
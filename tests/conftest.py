@@ -0,0 +1,5 @@
+import os
+import sys
+
+# main.pyと同じくリポジトリ直下をimportルートにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
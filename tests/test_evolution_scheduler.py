@@ -0,0 +1,123 @@
+import json
+import time
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import core.evolution_scheduler as evolution_scheduler
+from core.evolution_scheduler import EvolutionScheduler
+from core.evolution_transaction import EvolutionValidationError
+
+PROPOSAL = '{"new_agents": [{"id": "a3", "name": "A3", "role": "r", "goal": "g", "backstory": "b"}]}'
+
+@pytest.fixture(autouse=True)
+def tracker_dir(tmp_path, monkeypatch):
+    # EvolutionTrackerはカレントディレクトリのlogs/に書き込む
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+@pytest.fixture
+def applied(monkeypatch):
+    calls = []
+    outcome = {"result": {"generation": 1, "changed_files": ["agents.yaml"], "accepted": 1, "rejected": []}}
+
+    async def apply_evolution_async(evo):
+        calls.append(evo)
+        if isinstance(outcome["result"], Exception):
+            raise outcome["result"]
+        return outcome["result"]
+
+    monkeypatch.setattr(evolution_scheduler, "apply_evolution_async", apply_evolution_async)
+    return SimpleNamespace(calls=calls, outcome=outcome)
+
+def _scheduler(monkeypatch, outputs, **options):
+    """outputsの要素を順にevolution_crewの結果（例外なら送出）として返すスケジューラ"""
+    scheduler = EvolutionScheduler(**{"sample_rate": 1.0, "window_size": 3, "min_samples": 3, **options})
+    scheduler.kickoffs = 0
+
+    async def kickoff(digest):
+        output = outputs[min(scheduler.kickoffs, len(outputs) - 1)]
+        scheduler.kickoffs += 1
+        if isinstance(output, Exception):
+            raise output
+        return SimpleNamespace(raw=output, pydantic=None)
+
+    monkeypatch.setattr(scheduler, "_kickoff", kickoff)
+    return scheduler
+
+def _fill(scheduler, count=3):
+    for i in range(count):
+        scheduler.record(f"プロンプト{i}", "回答", latency=1.0)
+
+def _tracked():
+    with open("logs/evolution_log.json", encoding="utf-8") as f:
+        return [entry for entry in json.load(f) if entry.get("type") == "scheduled_evolution"]
+
+def test_latency_percentiles_use_successful_samples_only():
+    scheduler = EvolutionScheduler(sample_rate=1.0)
+    for latency in (1.0, 2.0, 3.0):
+        scheduler.record("ok", latency=latency)
+    scheduler.record("timeout", latency=60.0, error="timeout")
+    window = scheduler.build_digest(list(scheduler.samples))["window"]
+    assert (window["latency_p50"], window["latency_p95"]) == (2.0, 3.0)
+    assert window["error_rate"] == 0.25
+
+def test_applied_run(monkeypatch, applied):
+    scheduler = _scheduler(monkeypatch, ["提案です: " + PROPOSAL])
+    _fill(scheduler)
+    result = asyncio.run(scheduler.maybe_run())
+    assert result["status"] == "applied" and result["generation"] == 1
+    assert applied.calls[0]["new_agents"][0]["id"] == "a3"
+    assert len(scheduler.samples) == 0 and scheduler.runs == 1
+
+@pytest.mark.parametrize("output", ["進化案はありません", '{"new_agents": [{"id": "x"}]}'])
+def test_invalid_output_drops_the_window(monkeypatch, applied, output):
+    scheduler = _scheduler(monkeypatch, [output])
+    _fill(scheduler)
+    result = asyncio.run(scheduler.maybe_run())
+    assert result["status"] == "dropped"
+    assert applied.calls == []
+    assert len(scheduler.samples) == 0 and scheduler.dropped == 1
+    assert asyncio.run(scheduler.maybe_run()) is None
+    assert scheduler.kickoffs == 1
+    assert _tracked()[-1]["result"]["status"] == "dropped"
+
+def test_rejected_proposal_drops_the_window(monkeypatch, applied):
+    scheduler = _scheduler(monkeypatch, [PROPOSAL])
+    applied.outcome["result"] = EvolutionValidationError(["crew c1: 未定義のagent a1"])
+    _fill(scheduler)
+    assert asyncio.run(scheduler.maybe_run())["status"] == "dropped"
+    applied.outcome["result"] = {"generation": 1, "changed_files": [], "accepted": 0,
+                                 "rejected": [{"proposal": {}, "conflicts": ["task t1: 未定義のagent a1"]}]}
+    _fill(scheduler)
+    assert asyncio.run(scheduler.maybe_run())["status"] == "dropped"
+    assert scheduler.dropped == 2 and scheduler.failures == 0 and len(scheduler.samples) == 0
+
+def test_transient_failure_restores_samples_with_capped_backoff(monkeypatch, applied):
+    scheduler = _scheduler(monkeypatch, [RuntimeError("crew failed")] * 3 + [PROPOSAL],
+                           retry_seconds=10, max_retry_seconds=25)
+    _fill(scheduler)
+    delays = []
+    for _ in range(3):
+        assert asyncio.run(scheduler.maybe_run()) is None
+        delays.append(round(scheduler._retry_at - time.monotonic()))
+        assert asyncio.run(scheduler.maybe_run()) is None  # 待機中は実行しない
+        scheduler._retry_at = 0.0
+    assert delays == [10, 20, 25]
+    assert scheduler.kickoffs == 3 and len(scheduler.samples) == 3
+    assert asyncio.run(scheduler.maybe_run())["status"] == "applied"
+    assert scheduler._consecutive_failures == 0 and scheduler.failures == 3
+
+def test_restore_keeps_samples_recorded_during_the_run(monkeypatch, applied):
+    scheduler = _scheduler(monkeypatch, [RuntimeError("crew failed")], max_samples=4)
+
+    async def kickoff(digest):
+        scheduler.record("実行中のプロンプト", latency=1.0)
+        raise RuntimeError("crew failed")
+
+    monkeypatch.setattr(scheduler, "_kickoff", kickoff)
+    _fill(scheduler)
+    asyncio.run(scheduler.maybe_run())
+    assert [s["prompt"] for s in scheduler.samples] == ["プロンプト0", "プロンプト1", "プロンプト2", "実行中のプロンプト"]
+    assert scheduler.seen == 4
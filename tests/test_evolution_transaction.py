@@ -0,0 +1,118 @@
+import os
+import stat
+
+import pytest
+import yaml
+
+import core.evolution_transaction as evolution_transaction
+from core.evolution_transaction import EvolutionTransaction, EvolutionValidationError, apply_evolutions
+
+def _agent(name: str):
+    return {"name": name, "role": f"{name}の役割", "goal": f"{name}の目的", "backstory": f"{name}の経歴"}
+
+def _write(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(data, f, allow_unicode=True)
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    # EvolutionTrackerはカレントディレクトリのlogs/に書き込む
+    monkeypatch.chdir(tmp_path)
+    for name in ("agents", "tasks", "crews"):
+        (tmp_path / name).mkdir()
+    paths = {
+        "agents_path": str(tmp_path / "agents" / "main_agents.yaml"),
+        "tasks_path": str(tmp_path / "tasks" / "main_tasks.yaml"),
+        "crews_path": str(tmp_path / "crews"),
+        "lock_path": str(tmp_path / ".evolution.lock"),
+        "generation_path": str(tmp_path / "generation.json"),
+        "backup": False,
+    }
+    _write(paths["agents_path"], {"a1": _agent("A1"), "a2": _agent("A2")})
+    # legacy_taskの参照切れ（ghost）は既存の不整合で、今回の進化とは無関係
+    _write(paths["tasks_path"], {
+        "t1": {"description": "t1", "agent": "a1"},
+        "legacy_task": {"description": "legacy", "agent": "ghost"},
+    })
+    _write(str(tmp_path / "crews" / "c1.yaml"), {"c1": {"agents": ["a1"], "tasks": ["t1"]}})
+    return paths
+
+def _transaction(config):
+    return EvolutionTransaction(**config)
+
+def test_conflicting_proposal_is_rejected(config):
+    transaction = _transaction(config)
+    assert transaction.add({"new_agents": [dict(_agent("A3"), id="a3")]})
+    assert not transaction.add({"new_agents": [dict(_agent("Other"), id="a3")]})
+    assert transaction.rejected[0]["conflicts"] == ["agent:a3"]
+    result = transaction.commit()
+    assert result["accepted"] == 1
+    assert _read(config["agents_path"])["a3"]["name"] == "A3"
+
+def test_identical_duplicates_are_merged(config):
+    proposal = {"new_agents": [dict(_agent("A3"), id="a3")]}
+    result = apply_evolutions([proposal, dict(proposal)], **config)
+    assert result["accepted"] == 2
+    assert result["rejected"] == []
+    assert list(_read(config["agents_path"])) == ["a1", "a2", "a3"]
+
+def test_new_broken_reference_rejects_only_that_proposal(config):
+    result = apply_evolutions([{"new_agents": [dict(_agent("Good"), id="good")]},
+                               {"remove_agents": ["a1"]}], **config)
+    agents = _read(config["agents_path"])
+    assert "good" in agents and "a1" in agents
+    assert result["accepted"] == 1
+    assert result["rejected"][0]["proposal"] == {"remove_agents": ["a1"]}
+    assert any("a1" in error for error in result["rejected"][0]["conflicts"])
+
+def test_references_see_earlier_staged_proposals(config):
+    transaction = _transaction(config)
+    assert transaction.add({"new_agents": [dict(_agent("A3"), id="a3")]})
+    assert transaction.add({"new_tasks": [{"id": "t2", "description": "t2", "agent": "a3"}]})
+    assert not transaction.add({"new_tasks": [{"id": "t3", "description": "t3", "agent": "missing"}]})
+    # 既存の参照切れ（legacy_task → ghost）はどの進化案も拒否しない
+    assert transaction.add({"remove_agents": ["a2"]})
+    transaction.commit()
+    tasks = _read(config["tasks_path"])
+    assert tasks["t2"]["agent"] == "a3" and "t3" not in tasks
+
+def test_commit_rechecks_against_concurrent_changes(config):
+    transaction = _transaction(config)
+    assert transaction.add({"new_tasks": [{"id": "t2", "description": "t2", "agent": "a2"}]})
+    # add()の後に別プロセスがa2を削除した
+    _write(config["agents_path"], {"a1": _agent("A1")})
+    with pytest.raises(EvolutionValidationError):
+        transaction.commit()
+    assert "t2" not in _read(config["tasks_path"])
+    assert not os.path.exists(config["generation_path"])
+
+def test_one_write_per_changed_file(config, monkeypatch):
+    writes = []
+    original = evolution_transaction.atomic_write_yaml
+    monkeypatch.setattr(evolution_transaction, "atomic_write_yaml",
+                        lambda path, data: (writes.append(path), original(path, data)))
+    result = apply_evolutions([
+        {"new_agents": [dict(_agent("A3"), id="a3")]},
+        {"new_agents": [dict(_agent("A4"), id="a4")], "remove_agents": ["a2"]},
+        {"new_tasks": [{"id": "t2", "description": "t2", "agent": "a3"}]},
+    ], **config)
+    assert sorted(writes) == sorted([config["agents_path"], config["tasks_path"]])
+    assert sorted(result["changed_files"]) == sorted(writes)
+
+def test_generation_bumps_only_on_change(config):
+    first = apply_evolutions([{"new_agents": [dict(_agent("A3"), id="a3")]}], **config)
+    second = apply_evolutions([{"remove_agents": ["a3"]}], **config)
+    noop = apply_evolutions([{"remove_agents": ["not_there"]}], **config)
+    assert (first["generation"], second["generation"], noop["generation"]) == (1, 2, 2)
+    assert noop["changed_files"] == []
+
+def test_file_mode_is_preserved(config):
+    os.chmod(config["agents_path"], 0o640)
+    apply_evolutions([{"new_agents": [dict(_agent("A3"), id="a3")]}], **config)
+    assert stat.S_IMODE(os.stat(config["agents_path"]).st_mode) == 0o640
+    assert stat.S_IMODE(os.stat(config["generation_path"]).st_mode) == 0o644
+    assert not [name for name in os.listdir(os.path.dirname(config["agents_path"])) if name.endswith(".tmp")]
@@ -0,0 +1,118 @@
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from tools.fetch_engine import FetchEngine, estimate_tokens, sniff_charset
+
+class _Handler(BaseHTTPRequestHandler):
+    hits = {}
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.hits[self.path] = cls.hits.get(self.path, 0) + 1
+        if self.path.startswith("/slow"):
+            with cls.lock:
+                cls.active += 1
+                cls.max_active = max(cls.max_active, cls.active)
+            time.sleep(0.2)
+            with cls.lock:
+                cls.active -= 1
+            self._send(b"<p>slow</p>", "text/html; charset=utf-8")
+        elif self.path == "/large":
+            self._send(b"a" * 100_000, "text/plain; charset=utf-8")
+        elif self.path == "/long":
+            body = "<html><script>var secret = 1;</script><body>" + "<p>word word word</p>" * 500 + "</body></html>"
+            self._send(body.encode("utf-8"), "text/html; charset=utf-8")
+        elif self.path == "/sjis":
+            body = '<html><head><meta charset="Shift_JIS"></head><body><p>日本語のページ</p></body></html>'
+            self._send(body.encode("shift_jis"), "text/html")
+        else:
+            self._send(b"<p>hello</p>", "text/html; charset=utf-8")
+
+@pytest.fixture
+def server():
+    _Handler.hits = {}
+    _Handler.active = 0
+    _Handler.max_active = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+@pytest.fixture
+def make_engine():
+    engines = []
+
+    def factory(**options):
+        engine = FetchEngine(**options)
+        engines.append(engine)
+        return engine
+
+    yield factory
+    for engine in engines:
+        engine.close()
+
+def test_per_host_limit(server, make_engine):
+    engine = make_engine(per_host_limit=2)
+    urls = [f"{server}/slow/{i}" for i in range(6)]
+    threads = [threading.Thread(target=engine.fetch_text, args=(url,)) for url in urls]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert _Handler.max_active <= 2
+    assert sum(_Handler.hits.values()) == 6
+
+def test_prefetch_hit(server, make_engine):
+    engine = make_engine()
+    engine.prefetch([f"{server}/page"])
+    assert engine.fetch_text(f"{server}/page") == "hello"
+    assert engine.fetch_text(f"{server}/page") == "hello"
+    assert _Handler.hits["/page"] == 1
+
+def test_cache_ttl_expires(server, make_engine):
+    engine = make_engine(cache_ttl=0)
+    engine.fetch_text(f"{server}/page")
+    time.sleep(0.01)
+    engine.fetch_text(f"{server}/page")
+    assert _Handler.hits["/page"] == 2
+
+def test_size_cap(server, make_engine):
+    engine = make_engine(max_bytes=1000, token_budget=1_000_000)
+    assert len(engine.fetch_text(f"{server}/large")) == 1000
+
+def test_token_trim(server, make_engine):
+    engine = make_engine(token_budget=50)
+    text = engine.fetch_text(f"{server}/long")
+    assert "secret" not in text
+    assert text.startswith("word word word")
+    assert estimate_tokens(text) <= 60
+
+def test_meta_charset(server, make_engine):
+    engine = make_engine()
+    assert engine.fetch_text(f"{server}/sjis") == "日本語のページ"
+
+def test_sniff_charset_prefers_header():
+    head = b'<meta http-equiv="Content-Type" content="text/html; charset=euc-jp">'
+    assert sniff_charset(head) == "euc_jp"
+    assert sniff_charset(head, "utf-8") == "utf-8"
+    assert sniff_charset(b"<p>no meta</p>") == "utf-8"
+    assert sniff_charset(b'<meta charset="unknown-x">') == "utf-8"
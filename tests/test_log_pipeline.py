@@ -0,0 +1,47 @@
+import json
+import queue
+import logging
+
+import pytest
+
+from utils.log_pipeline import LazyJSON, LazyQueueHandler
+
+class CountingJSON(LazyJSON):
+    formatted = 0
+
+    def __str__(self):
+        type(self).formatted += 1
+        return super().__str__()
+
+@pytest.fixture
+def queued():
+    records = queue.SimpleQueue()
+    # pytestのログキャプチャ（ルートロガー側で整形する）の影響を受けないよう階層外のロガーを使う
+    logger = logging.Logger("tests.log_pipeline", logging.DEBUG)
+    logger.addHandler(LazyQueueHandler(records))
+    return logger, records
+
+def test_lazy_json_is_formatted_by_the_listener(queued):
+    logger, records = queued
+    CountingJSON.formatted = 0
+    logger.debug("config: %s", CountingJSON({"agents": ["a1"]}))
+    record = records.get_nowait()
+    assert CountingJSON.formatted == 0
+    assert json.loads(record.getMessage().split(": ", 1)[1]) == {"agents": ["a1"]}
+
+def test_plain_args_are_fixed_at_call_time(queued):
+    logger, records = queued
+    agents = ["a1"]
+    logger.info("agents: %s", agents)
+    agents.append("a2")
+    record = records.get_nowait()
+    assert record.getMessage() == "agents: ['a1']"
+    assert record.args is None
+
+def test_disabled_level_never_formats(queued):
+    logger, records = queued
+    logger.setLevel(logging.INFO)
+    CountingJSON.formatted = 0
+    logger.debug("config: %s", CountingJSON({"agents": ["a1"]}))
+    assert records.empty()
+    assert CountingJSON.formatted == 0
@@ -0,0 +1,132 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from core.similarity_index import MinHashIndex
+from core.yaml_validator import YAMLValidator
+
+EXISTING = {
+    "research_agent": {
+        "name": "ResearchAgent",
+        "role": "リサーチ担当",
+        "goal": "ユーザーの質問に関連する最新情報をウェブから収集し、出典付きで要約する",
+        "backstory": "検索エンジンと一次資料の読み込みに長けた調査の専門家。信頼できる情報源のみを扱う。",
+        "tools": ["brave_search"],
+    },
+}
+
+def _candidate(agent_id: str, **overrides):
+    agent = {
+        "id": agent_id,
+        "name": agent_id.title(),
+        "role": f"{agent_id}専用の担当",
+        "goal": f"{agent_id}に関する依頼を分析し、手順を組み立てて実行する",
+        "backstory": f"{agent_id}の分野で長年の実務経験を持つスペシャリスト。",
+    }
+    agent.update(overrides)
+    return agent
+
+@pytest.fixture
+def validator(tmp_path, monkeypatch):
+    # EvolutionTrackerはカレントディレクトリのlogs/に書き込む
+    monkeypatch.chdir(tmp_path)
+    return YAMLValidator({k: dict(v) for k, v in EXISTING.items()}, {})
+
+def _fake_ai(monkeypatch, validator, verdicts=None, error=None):
+    calls = []
+
+    async def ai_validate_agents(agents):
+        calls.append([a.get("id") for a in agents])
+        if error is not None:
+            raise error
+        return list(verdicts) if verdicts is not None else [True] * len(agents)
+
+    monkeypatch.setattr(validator, "ai_validate_agents", ai_validate_agents)
+    return calls
+
+def test_minhash_query_and_remove():
+    index = MinHashIndex()
+    index.add("a", "ユーザーの質問に関連する最新情報をウェブから収集する")
+    index.add("b", "社内の経費精算ルールを説明する")
+    matches = index.query("ユーザーの質問に関連する最新情報をウェブから収集する", 0.9)
+    assert [key for key, _ in matches] == ["a"]
+    assert [key for key, _ in index.most_similar("経費精算", 1, exclude={"a"})] == ["b"]
+    index.remove("a")
+    assert index.query("ユーザーの質問に関連する最新情報をウェブから収集する", 0.9) == []
+    assert set(index.keys()) == {"b"}
+
+def test_exact_duplicate(validator):
+    assert validator.is_duplicate_agent({"id": "research_agent"})
+    copied = dict(EXISTING["research_agent"], id="research_agent_2")
+    assert validator.is_duplicate_agent(copied)
+    assert not validator.is_duplicate_agent(_candidate("planner"))
+
+def test_near_duplicate(validator):
+    near = dict(EXISTING["research_agent"], id="researcher", name="Researcher", tools=[])
+    near["backstory"] += "。"
+    assert not validator.is_duplicate_agent(near)
+    assert validator.find_near_duplicate_agent(near) == "research_agent"
+    assert validator.find_near_duplicate_agent(_candidate("planner")) is None
+
+def test_rule_validation_matches_agent_definition(validator):
+    # AgentDefinitionにはtoolsがなく、idがなければnameをキーにする
+    assert validator._rule_validate_agent(_candidate("planner", id=None, name="Planner"))
+    assert not validator._rule_validate_agent(_candidate("planner", id=None, name=None))
+    assert not validator._rule_validate_agent(_candidate("planner", backstory=""))
+
+def test_duplicates_among_candidates(validator, monkeypatch):
+    calls = _fake_ai(monkeypatch, validator)
+    first = _candidate("planner")
+    second = dict(first, id="planner_copy")
+    results = asyncio.run(validator.validate_agents([first, second, _candidate("writer")]))
+    assert results == [True, False, True]
+    assert calls == [["planner", "writer"]]
+    assert validator._pending_agent_ids == set()
+    # 合格した候補は後続の判定のためインデックスに残る
+    assert validator.is_duplicate_agent(dict(first, id="planner_again"))
+
+def test_ai_rejected_candidates_are_unindexed(validator, monkeypatch):
+    _fake_ai(monkeypatch, validator, verdicts=[False, True])
+    rejected, accepted = _candidate("planner"), _candidate("writer")
+    assert asyncio.run(validator.validate_agents([rejected, accepted])) == [False, True]
+    assert validator.find_near_duplicate_agent(rejected) is None
+    assert not validator.is_duplicate_agent(dict(rejected, id="planner_retry"))
+    assert validator.find_near_duplicate_agent(accepted) == "writer"
+
+def test_ai_failure_unindexes_all_candidates(validator, monkeypatch):
+    _fake_ai(monkeypatch, validator, error=RuntimeError("crew failed"))
+    candidate = _candidate("planner")
+    with pytest.raises(RuntimeError):
+        asyncio.run(validator.validate_agents([candidate]))
+    assert validator._pending_agent_ids == set()
+    assert validator.find_near_duplicate_agent(candidate) is None
+
+def test_rule_failures_skip_ai(validator, monkeypatch):
+    calls = _fake_ai(monkeypatch, validator)
+    assert asyncio.run(validator.validate_agents([{"id": "broken"}])) == [False]
+    assert calls == []
+
+@pytest.mark.parametrize("raw, expected", [
+    ('{"results": [{"index": 0, "is_duplicate": false}, {"index": 1, "is_duplicate": true}]}', [True, False, False]),
+    ('判定結果: {"results": [{"index": 2, "is_duplicate": false}]} 以上', [False, False, True]),
+    ('{"results": [{"index": 0, "is_duplicate": "false"}, {"index": 1, "is_duplicate": null}]}', [False, False, False]),
+    ('{"results": [{"index": 0}, "oops", {"index": true, "is_duplicate": false}, {"index": 9, "is_duplicate": false}]}',
+     [False, False, False]),
+    ('{"results": [{"index": 0, "is_duplicate": true}, {"index": 0, "is_duplicate": false}]}', [False, False, False]),
+])
+def test_parse_validation_results(raw, expected):
+    assert YAMLValidator._parse_validation_results(raw, 3) == expected
+
+@pytest.mark.parametrize("raw", [None, "", "重複はありません", '{"is_duplicate": false}', '{"results": "none"}'])
+def test_parse_validation_results_unreadable(raw):
+    assert YAMLValidator._parse_validation_results(raw, 2) is None
+
+def test_draft_verdict_only_when_revise_skipped():
+    draft = SimpleNamespace(name="validate_agent_task", raw="draft")
+    feedback = SimpleNamespace(name="feedback_task", raw='{"score": 0.3}')
+    revised = SimpleNamespace(raw="revised", tasks_output=[draft, feedback, SimpleNamespace(name="revise_task", raw="revised")])
+    assert YAMLValidator._verdict_candidates(revised, "revise_task") == ["revised"]
+    # スキップされたConditionalTaskの出力はnameなし・rawが空
+    skipped = SimpleNamespace(raw="draft", tasks_output=[draft, feedback, SimpleNamespace(name=None, raw="")])
+    assert YAMLValidator._verdict_candidates(skipped, "revise_task") == ["draft", "draft"]
@@ -0,0 +1,261 @@
+import re
+import atexit
+import codecs
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from html.parser import HTMLParser
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "iframe", "canvas"}
+BLOCK_TAGS = {
+    "p", "div", "br", "li", "ul", "ol", "tr", "table", "section", "article",
+    "header", "footer", "h1", "h2", "h3", "h4", "h5", "h6", "pre", "blockquote", "title",
+}
+# <meta charset="..."> と <meta http-equiv="Content-Type" content="...; charset=..."> の両方に一致
+META_CHARSET_PATTERN = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([A-Za-z0-9_.:-]+)""", re.IGNORECASE)
+SNIFF_BYTES = 2048
+
+def estimate_tokens(text: str) -> float:
+    """トークン数の概算（ASCIIは4文字≒1トークン、日本語等は1文字≒1トークン）"""
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return ascii_chars / 4 + (len(text) - ascii_chars)
+
+def trim_to_tokens(text: str, token_budget: float) -> str:
+    """概算トークン数がtoken_budget以内に収まるよう先頭から切り詰める"""
+    if estimate_tokens(text) <= token_budget:
+        return text
+    used = 0.0
+    for i, c in enumerate(text):
+        used += 0.25 if ord(c) < 128 else 1
+        if used > token_budget:
+            return text[:i]
+    return text
+
+def sniff_charset(head: bytes, header_charset: Optional[str] = None) -> str:
+    """Content-Typeヘッダー → BOM → 先頭の<meta>の順で文字コードを決める（不明ならutf-8）"""
+    candidates = [header_charset]
+    if head.startswith(codecs.BOM_UTF8):
+        candidates.append("utf-8-sig")
+    elif head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        candidates.append("utf-16")
+    match = META_CHARSET_PATTERN.search(head[:SNIFF_BYTES])
+    if match:
+        candidates.append(match.group(1).decode("ascii"))
+    for charset in candidates:
+        if not charset:
+            continue
+        try:
+            return codecs.lookup(charset).name
+        except LookupError:
+            logging.debug(f"未知の文字コードを無視: {charset}")
+    return "utf-8"
+
+class StreamingTextExtractor(HTMLParser):
+    """
+    HTMLを逐次feedしてテキストを抽出する。
+    token_budgetに達した時点でfullになり、呼び出し側は受信を打ち切れる。
+    """
+
+    def __init__(self, token_budget: int):
+        super().__init__(convert_charrefs=True)
+        self.token_budget = token_budget
+        self.tokens = 0.0
+        self.full = False
+        self._chunks: List[str] = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self._chunks.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag in BLOCK_TAGS:
+            self._chunks.append("\n")
+
+    def handle_data(self, data):
+        if self.full or self._skip_depth:
+            return
+        text = " ".join(data.split())
+        if not text:
+            return
+        cost = estimate_tokens(text) + 0.25
+        if self.tokens + cost > self.token_budget:
+            text = trim_to_tokens(text, self.token_budget - self.tokens)
+            self.full = True
+        self.tokens += cost
+        self._chunks.append(text + " ")
+
+    def text(self) -> str:
+        raw = "".join(self._chunks)
+        lines = (line.strip() for line in raw.splitlines())
+        return "\n".join(line for line in lines if line)
+
+class FetchEngine:
+    """
+    専用イベントループ上で動く非同期HTTP取得エンジン。
+    - httpx.AsyncClientのコネクションプールを共有
+    - ホストごとの同時接続数制限
+    - レスポンスサイズ上限（max_bytes）
+    - HTML→テキストのストリーミング抽出とトークン予算での打ち切り
+    - prefetch済みURLの結果をLRUキャッシュ（cache_ttl秒で失効）で再利用
+    ツール（crewAIエージェント）からは同期APIで呼び出せる（ツール定義はtools/web_fetch.py）。
+    """
+
+    def __init__(self, max_connections: int = 20, per_host_limit: int = 4,
+                 max_bytes: int = 2_000_000, token_budget: int = 4000,
+                 timeout: float = 15.0, cache_size: int = 64, cache_ttl: float = 300.0,
+                 user_agent: str = "SEACOR-Fetch/1.0"):
+        self.per_host_limit = per_host_limit
+        self.max_bytes = max_bytes
+        self.token_budget = token_budget
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        # URL → (取得開始時刻, 取得タスク)
+        self._cache: "OrderedDict[str, Tuple[float, asyncio.Future]]" = OrderedDict()
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="seacor-fetch", daemon=True)
+        self._thread.start()
+        self._client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=timeout,
+            headers={"User-Agent": user_agent},
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections),
+        )
+
+    # --- 同期API（ツール・ワーカースレッドから利用） ---
+
+    def fetch_text(self, url: str) -> str:
+        """URLを取得しテキスト化して返す（prefetch済みならキャッシュを利用）"""
+        future = asyncio.run_coroutine_threadsafe(self._get_or_fetch(url), self._loop)
+        return future.result(timeout=self.timeout * 2)
+
+    def prefetch(self, urls: Iterable[str]):
+        """URL群の取得をバックグラウンドで開始する（結果は待たない）"""
+        for url in urls:
+            asyncio.run_coroutine_threadsafe(self._get_or_fetch(url), self._loop)
+
+    # --- 非同期API（別イベントループのコルーチンから利用） ---
+
+    async def afetch_text(self, url: str) -> str:
+        future = asyncio.run_coroutine_threadsafe(self._get_or_fetch(url), self._loop)
+        return await asyncio.wrap_future(future)
+
+    def close(self):
+        if not self._loop.is_running():
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    # --- 以下はエンジンのイベントループ上でのみ実行 ---
+
+    async def _shutdown(self):
+        await self._client.aclose()
+        # 途中で打ち切った取得が残したhttpx内部のジェネレータを、ループ停止前に閉じ切る
+        await self._loop.shutdown_asyncgens()
+        pending = [t for t in asyncio.all_tasks(self._loop) if t is not asyncio.current_task()]
+        if pending:
+            await asyncio.wait(pending, timeout=1)
+
+    async def _get_or_fetch(self, url: str) -> str:
+        entry = self._cache.get(url)
+        if entry is not None and self._loop.time() - entry[0] > self.cache_ttl:
+            del self._cache[url]
+            entry = None
+        if entry is None:
+            entry = (self._loop.time(), self._loop.create_task(self._fetch(url)))
+            self._cache[url] = entry
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(url)
+        try:
+            return await asyncio.shield(entry[1])
+        except Exception as e:
+            # 失敗結果はキャッシュしない
+            if self._cache.get(url) is entry:
+                del self._cache[url]
+            logging.warning(f"web取得失敗: {url} ({e})")
+            return f"取得失敗: {url} ({e})"
+
+    def _semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc.lower()
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_semaphores[host]
+
+    async def _fetch(self, url: str) -> str:
+        async with self._semaphore(url):
+            async with self._client.stream("GET", url) as response:
+                response.raise_for_status()
+                content_type = response.headers.get("content-type", "").lower()
+                if content_type and not content_type.startswith(("text/", "application/xhtml", "application/xml", "application/json")):
+                    return f"未対応のContent-Type: {content_type} ({url})"
+                length = response.headers.get("content-length")
+                if length and length.isdigit() and int(length) > self.max_bytes:
+                    logging.info(f"レスポンスサイズ上限超過のため先頭のみ取得: {url} ({length} bytes)")
+                is_html = "html" in content_type or not content_type
+                extractor = StreamingTextExtractor(self.token_budget) if is_html else None
+                plain: List[str] = []
+                plain_tokens = 0.0
+
+                def consume(text: str) -> bool:
+                    """テキストを抽出器に渡し、トークン予算に達したらTrue"""
+                    nonlocal plain_tokens
+                    if extractor is not None:
+                        extractor.feed(text)
+                        return extractor.full
+                    plain.append(text)
+                    plain_tokens += estimate_tokens(text)
+                    return plain_tokens >= self.token_budget
+
+                # ヘッダーにcharsetがない場合は先頭SNIFF_BYTESの<meta>から判定してからデコードする
+                decoder = None
+                head = b""
+                received = 0
+                async for chunk in response.aiter_bytes():
+                    chunk = chunk[:self.max_bytes - received]
+                    received += len(chunk)
+                    if decoder is None:
+                        head += chunk
+                        if len(head) < SNIFF_BYTES and received < self.max_bytes:
+                            continue
+                        decoder = self._decoder(response, head)
+                        chunk = head
+                    if consume(decoder.decode(chunk)) or received >= self.max_bytes:
+                        break
+                if decoder is None:
+                    consume(self._decoder(response, head).decode(head, final=True))
+                if extractor is not None:
+                    extractor.close()
+                    return extractor.text()
+                return trim_to_tokens("".join(plain), self.token_budget)
+
+    @staticmethod
+    def _decoder(response: httpx.Response, head: bytes) -> codecs.IncrementalDecoder:
+        charset = sniff_charset(head, response.charset_encoding)
+        return codecs.getincrementaldecoder(charset)(errors="replace")
+
+_engine: Optional[FetchEngine] = None
+_engine_lock = threading.Lock()
+
+def get_fetch_engine(**options) -> FetchEngine:
+    """プロセス共有のFetchEngineを返す（初回呼び出し時のoptionsで生成）"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = FetchEngine(**options)
+            atexit.register(_engine.close)
+        return _engine
@@ -0,0 +1,41 @@
+import re
+from collections import OrderedDict
+from typing import Any, Dict, Type
+
+from pydantic import BaseModel, Field
+from crewai.tools import BaseTool
+from crewai_tools import BraveSearchTool
+from tools.fetch_engine import get_fetch_engine
+
+URL_PATTERN = re.compile(r"https?://[^\s\"'<>)\]]+")
+
+class ScrapeWebsiteInput(BaseModel):
+    website_url: str = Field(..., description="内容を取得するウェブサイトのURL")
+
+class FetchScrapeWebsiteTool(BaseTool):
+    """ScrapeWebsiteTool互換のスクレイピングツール（FetchEngine経由でテキストのみ返す）"""
+    name: str = "Read website content"
+    description: str = "指定したURLのウェブページ本文をテキストとして取得する"
+    args_schema: Type[BaseModel] = ScrapeWebsiteInput
+    engine_options: Dict[str, Any] = {}
+
+    def _run(self, website_url: str) -> str:
+        return get_fetch_engine(**self.engine_options).fetch_text(website_url)
+
+class PrefetchBraveSearchTool(BraveSearchTool):
+    """検索結果の上位prefetch_top_n件のURLをFetchEngineで先読みするBraveSearchTool"""
+    prefetch_top_n: int = 3
+    engine_options: Dict[str, Any] = {}
+
+    def _run(self, **kwargs: Any) -> Any:
+        result = super()._run(**kwargs)
+        if self.prefetch_top_n > 0:
+            urls = list(OrderedDict.fromkeys(URL_PATTERN.findall(str(result))))[:self.prefetch_top_n]
+            if urls:
+                get_fetch_engine(**self.engine_options).prefetch(urls)
+        return result
+
+SEACOR_TOOLS = {
+    "FetchScrapeWebsiteTool": FetchScrapeWebsiteTool,
+    "PrefetchBraveSearchTool": PrefetchBraveSearchTool,
+}
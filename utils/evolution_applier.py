@@ -1,77 +1,29 @@
-import os
-import yaml
-import json
-from utils.backup_and_rollback import backup_configs
+from core.agent_generator import AgentGenerator
+from core.evolution_transaction import AGENTS_PATH, TASKS_PATH, CREWS_DIR
 
-AGENTS_PATH = "config/agents/main_agents.yaml"
-CREWS_DIR = "config/crews"
+def _generator() -> AgentGenerator:
+    return AgentGenerator(AGENTS_PATH, TASKS_PATH, CREWS_DIR)
 
-REQUIRED_AGENT_FIELDS = ["name", "goal", "role", "backstory"]
+def _report(result: dict):
+    if result["rejected"]:
+        print(f"[警告] 競合により拒否された進化案: {result['rejected']}")
+    print(f"進化案を適用しました（generation={result['generation']}, 変更ファイル={result['changed_files']}）")
 
-def load_yaml(path):
-    with open(path, encoding="utf-8") as f:
-        return yaml.safe_load(f)
-
-def save_yaml(path, data):
-    with open(path, "w", encoding="utf-8") as f:
-        yaml.safe_dump(data, f, allow_unicode=True)
+async def apply_evolution_async(evo: dict):
+    """
+    新規エージェント/タスクをバリデーション（AI判定は全候補まとめて1回）した上で、
+    進化案を1トランザクションで適用する（検証1回・変更ファイルのみアトミック書き込み・世代番号更新）。
+    イベントループ上（FastAPI・スケジューラ）からはこちらを使う。
+    """
+    result = await _generator().apply_evolution_async(evo)
+    _report(result)
+    return result
 
 def apply_evolution(evo: dict):
-    # 1. バックアップ
-    backup_configs()
-    # 2. agentsロード
-    agents = load_yaml(AGENTS_PATH)
-    # 3. 新規agent追加
-    new_agents = evo.get("new_agents", [])
-    for agent in new_agents:
-        if isinstance(agent, dict):
-            # 不足属性を自動補完
-            for field in REQUIRED_AGENT_FIELDS:
-                if field not in agent:
-                    agent[field] = ""
-            key = agent.get("id") or agent.get("name")
-            if key:
-                agents[key] = agent
-            else:
-                print(f"[警告] agent定義にid/nameがありません: {agent}")
-        elif isinstance(agent, str):
-            print(f"[警告] agent定義が不完全: {agent}")
-    # 4. agent削除
-    remove_agents = evo.get("remove_agents", [])
-    for agent in remove_agents:
-        if isinstance(agent, dict):
-            key = agent.get("id") or agent.get("name")
-            if key and key in agents:
-                del agents[key]
-        elif isinstance(agent, str):
-            if agent in agents:
-                del agents[agent]
-    # 5. agent統合（merge_agents）
-    for merge in evo.get("merge_agents", []):
-        if "from" in merge and "to" in merge and "definition" in merge:
-            for aid in merge["from"]:
-                if aid in agents:
-                    del agents[aid]
-            agents[merge["to"]] = merge["definition"]
-    # 6. agents保存
-    save_yaml(AGENTS_PATH, agents)
-
-    # === crews/flowの自動適用 ===
-    # 追加・削除は無効化
-    # 修正のみ: update_crews
-    update_crews = evo.get("update_crews", [])
-    for crew in update_crews:
-        if isinstance(crew, dict):
-            crew_name = crew.get("name")
-            if not crew_name:
-                print(f"[警告] crew修正定義にnameがありません: {crew}")
-                continue
-            path = os.path.join(CREWS_DIR, f"{crew_name}.yaml")
-            if os.path.exists(path):
-                save_yaml(path, {"MetaCrew": crew})
-                print(f"クルー修正: {crew_name}")
-            else:
-                print(f"[警告] crewファイルが存在しません（修正スキップ）: {path}")
-        else:
-            print(f"[警告] crew修正定義が不完全: {crew}")
-    print(f"進化案を適用しました（YAML自動編集・クルー/フロー修正のみ）") 
\ No newline at end of file
+    """
+    apply_evolution_asyncの同期版（CLI・crewのtask callback等、イベントループ外専用）。
+    バリデーションなしで複数の進化案をまとめて適用する場合は core.evolution_transaction.apply_evolutions を使う。
+    """
+    result = _generator().apply_evolution(evo)
+    _report(result)
+    return result
@@ -2,6 +2,8 @@ from pydantic import BaseModel, Field
 from typing import List, Optional
 
 class AgentDefinition(BaseModel):
+    id: Optional[str] = None
+    name: Optional[str] = None
     role: str
     goal: str
     backstory: str
@@ -0,0 +1,156 @@
+import os
+import copy
+import json
+import queue
+import atexit
+import random
+import logging
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+# リクエスト・クルー・タスク単位の相関ID（asyncio.to_threadにも引き継がれる）
+request_id_var: contextvars.ContextVar = contextvars.ContextVar("request_id", default=None)
+crew_var: contextvars.ContextVar = contextvars.ContextVar("crew", default=None)
+task_var: contextvars.ContextVar = contextvars.ContextVar("task", default=None)
+
+_listener: Optional[QueueListener] = None
+
+@contextmanager
+def log_context(**values):
+    """with log_context(request_id=..., crew=..., task=...): の範囲のログに相関IDを付与する"""
+    variables = {"request_id": request_id_var, "crew": crew_var, "task": task_var}
+    tokens = [(variables[k], variables[k].set(v)) for k, v in values.items()]
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+class LazyJSON:
+    """
+    ログ出力時にだけjson.dumpsする（無効なレベルのログでは整形コストがかからず、
+    有効な場合もQueueListenerのスレッドで整形される）。
+    整形はログ呼び出しより後になるため、呼び出し後に変更するオブジェクトはdict(...)等のスナップショットを渡すこと
+    """
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __str__(self):
+        return json.dumps(self.obj, ensure_ascii=False, indent=2, default=str)
+
+class ContextFilter(logging.Filter):
+    """呼び出し元スレッドのcontextvarsから相関IDをレコードに付与する"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        record.crew = crew_var.get()
+        record.task = task_var.get()
+        return True
+
+class DebugSamplingFilter(logging.Filter):
+    """DEBUG以下のレコードをsample_rateの確率で間引く（INFO以上は常に通す）"""
+
+    def __init__(self, sample_rate: float = 1.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.sample_rate >= 1.0:
+            return True
+        return random.random() < self.sample_rate
+
+class JSONFormatter(logging.Formatter):
+    """1レコード1行のJSON（構造化ログ）"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "crew": getattr(record, "crew", None),
+            "task": getattr(record, "task", None),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class LazyQueueHandler(QueueHandler):
+    """
+    呼び出し元では通常の引数のみ%展開してキューに積む。
+    LazyJSONを含むメッセージ・スタックトレースの整形やJSON化はリスナースレッド側で行う（同一プロセス内キュー前提）。
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        args = record.args if isinstance(record.args, tuple) else (record.args,)
+        if not any(isinstance(arg, LazyJSON) for arg in args):
+            # 通常の引数は呼び出し時点の値で確定させる（後から変更されるオブジェクト対策）
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+def parse_module_levels(spec: str) -> Dict[str, int]:
+    """"crews.generic_crew=DEBUG,httpx=WARNING" 形式をパースする"""
+    levels = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        name, level = item.split("=", 1)
+        levels[name.strip()] = getattr(logging, level.strip().upper(), logging.INFO)
+    return levels
+
+def setup_logging(log_file: Optional[str] = None, level: Optional[str] = None,
+                  module_levels: Optional[str] = None, sample_rate: Optional[float] = None,
+                  console: bool = True) -> QueueListener:
+    """
+    ルートロガーをキュー経由のバックグラウンド書き込みに切り替える。
+    イベントループ側はレコードをキューに積むだけで、JSON整形・ファイル/標準出力への書き込みは
+    QueueListenerのスレッドで行う。環境変数:
+      LOG_FILE, SEACOR_LOG_LEVEL, SEACOR_LOG_LEVELS（モジュール別）, SEACOR_DEBUG_SAMPLE_RATE
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    log_file = log_file or os.environ.get("LOG_FILE", "logs/task.log")
+    level = level or os.environ.get("SEACOR_LOG_LEVEL", "INFO")
+    module_levels = module_levels if module_levels is not None else os.environ.get("SEACOR_LOG_LEVELS", "")
+    if sample_rate is None:
+        sample_rate = float(os.environ.get("SEACOR_DEBUG_SAMPLE_RATE", "1.0"))
+
+    formatter = JSONFormatter()
+    handlers = []
+    if log_file:
+        os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+        file_handler = logging.FileHandler(log_file, encoding="utf-8")
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+    if console:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(formatter)
+        handlers.append(stream_handler)
+
+    queue_handler = LazyQueueHandler(queue.SimpleQueue())
+    # 間引かれるレコードには相関IDの付与も行わない
+    queue_handler.addFilter(DebugSamplingFilter(sample_rate))
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, level.upper(), logging.INFO))
+    for name, module_level in parse_module_levels(module_levels).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
@@ -0,0 +1,9 @@
+from pydantic import BaseModel, Field
+from typing import List
+
+class QualityVerdict(BaseModel):
+    """フィードバックtaskが出力する構造化評価（品質ゲート判定用）"""
+    score: float = Field(..., ge=0.0, le=1.0)
+    passed: bool = False
+    issues: List[str] = []
+    suggestions: List[str] = []
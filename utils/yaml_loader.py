@@ -17,15 +17,15 @@ def load_yaml(path):
                     result.update(data)
         return result
     else:
-    with open(path, encoding="utf-8") as f:
-        return yaml.safe_load(f)
+        with open(path, encoding="utf-8") as f:
+            return yaml.safe_load(f)
 
 def reencode_json_to_utf8(json_path):
     """JSONファイルをUTF-8で再エンコードするユーティリティ"""
     try:
         with open(json_path, encoding="utf-8") as f:
-        data = json.load(f)
+            data = json.load(f)
         with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+            json.dump(data, f, ensure_ascii=False, indent=2)
     except Exception as e:
         print(f"reencode_json_to_utf8 error: {e}")